@@ -12,12 +12,27 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import requests
-import json
-import time
+import matplotlib
+matplotlib.use("Agg")   # headless server: pin the backend before anything touches matplotlib
+from matplotlib.figure import Figure
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import orjson
 import re
+import atexit
 import io
+import os
+import pickle
+import sqlite3
+import hashlib
+import threading
+import time
+import uuid
+from math import isfinite
 from datetime import datetime, timezone
+from functools import lru_cache, partial
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # ── Page Config ───────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -50,8 +65,43 @@ GEO_RISK_TIERS   = {
     "Unknown":4,"N/A":4,"_DEFAULT_":4,
 }
 RISK_CATEGORIES  = {'high':(6.6,10.0), 'moderate':(3.6,6.5), 'low':(0.0,3.5)}
+RISK_HIGH_MIN    = RISK_CATEGORIES['high'][0]       # band floors used for counts, filters and colours
+RISK_MOD_MIN     = RISK_CATEGORIES['moderate'][0]
 API_TIMEOUT      = 20
-MAX_WORKERS      = 6
+MAX_WORKERS      = 32
+RATE_LIMIT_RPS   = 10     # sustained requests/second per supplier API key
+RATE_LIMIT_BURST = 12     # requests allowed back-to-back before throttling kicks in
+MOUSER_BATCH_SIZE = 10    # part numbers per Mouser request (API max, pipe-separated)
+NEXAR_BATCH_SIZE  = 10    # part numbers per Nexar request (one aliased supSearch each)
+SUPPLIER_CACHE_ENTRIES = 5000   # per-supplier memo bound (1h TTL) so long sessions can't grow it unbounded
+DISK_CACHE_DIR   = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bom_cache")
+DISK_CACHE_TTL   = 6 * 3600       # supplier results survive app restarts for 6h
+
+# Shared HTTP session: keeps TCP+TLS connections to suppliers alive across requests.
+# Held in cache_resource because Streamlit re-executes this module on every rerun.
+# Pool sized to the worker count; 429/5xx are retried with exponential backoff
+# (honouring Retry-After), and the final response is returned for raise_for_status.
+@st.cache_resource
+def _http_session():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=8, pool_maxsize=MAX_WORKERS,
+        max_retries=Retry(total=3, backoff_factor=0.4, status_forcelist=[429,500,502,503,504],
+                          allowed_methods=["POST","GET"], raise_on_status=False)))
+    atexit.register(session.close)
+    return session
+
+_HTTP = _http_session()
+
+
+# Supplier lookups run on one process-wide pool rather than a pool per analysis:
+# threads are started once and shared by every session (which already share the
+# HTTP session and rate limiters, so concurrency stays bounded at MAX_WORKERS).
+@st.cache_resource
+def _supplier_pool():
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="API")
+    atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+    return pool
 
 # Country name → ISO2 helpers for COO matching
 COUNTRY_ISO = {
@@ -61,29 +111,73 @@ COUNTRY_ISO = {
     "IE":"Ireland","CH":"Switzerland","RU":"Russia",
 }
 
+# Precompiled parsing helpers and lower-cased lookup tables (built once, not per call)
+_FLOAT_NULLS = frozenset({'n/a','none','inf','-inf','na','nan',''})
+_LT_NULLS    = frozenset({'n/a','unknown','','na','none'})
+_FLOAT_TYPES = (int, float, np.integer, np.floating)
+_LT_RE       = re.compile(r'(\d+(?:\.\d+)?)')
+_EOL_RE      = re.compile(r'OBSOLETE|EOL|DISCONTINUED|NOT RECOMMENDED', re.I)
+_DISC_RE     = re.compile(r'DISCONTINUED', re.I)
+_LC_RISK_RE  = re.compile(r'EOL|DISC', re.I)
+_GEO_DEFAULT = GEO_RISK_TIERS.get("_DEFAULT_", 4)
+_GEO_LOWER   = {k.lower(): v for k, v in GEO_RISK_TIERS.items() if k != "_DEFAULT_"}
+# Exact-match fast paths: whole COO string → geo score / country name (incl. ISO2 codes)
+_ISO_TO_NAME = {iso.lower(): name.lower() for iso, name in COUNTRY_ISO.items()}
+_GEO_EXACT   = {**_GEO_LOWER, **{iso: _GEO_LOWER[name] for iso, name in _ISO_TO_NAME.items()}}
+
+# BOM CSV header aliases (lower-case, spaces/underscores/dots removed) → canonical column
+_COLUMN_ALIASES = {alias: canon for canon, aliases in {
+    "Part Number":  ["partnumber","pn","mpn","partno","partnum"],
+    "Quantity":     ["quantity","qty","q","amount","qtyperunit"],
+    "Manufacturer": ["manufacturer","mfg","mfr"],
+    "Description":  ["description","desc","partdescription"],
+}.items() for alias in aliases}
+_HEADER_JUNK_RE = re.compile(r"[ _.]")
+# Part-number suffixes stripped by clean_part_number, checked in this order
+_PBFREE_SUFFIXES = (" PBFREE", "-PBFREE", "_PBFREE", " PB-FREE", "-PB-FREE", " PB FREE")
+_DIST_SUFFIXES   = ("-ND", "-1-ND", "-2-ND", "-TR", "-T&R", "-TRC", "-CT", "-CUT", "-REEL", "/T", "-T")
+
 # ── Utility Functions (ported from source) ─────────────────────────────────────
 
+def _notna(x):
+    """Scalar-only pd.notna: NaN is the one value that is not equal to itself."""
+    return x is not None and x == x
+
+
 def safe_float(value, default=np.nan):
     if value is None or isinstance(value, bool): return default
-    if isinstance(value, (int,float)):
-        return float(value) if not np.isinf(value) else default
+    if isinstance(value, _FLOAT_TYPES):
+        return float(value) if value != value or isfinite(value) else default
     try:
         s = str(value).strip().replace('$','').replace(',','').replace('%','').lower()
-        if not s or s in ['n/a','none','inf','-inf','na','nan','']: return default
+        if s in _FLOAT_NULLS: return default
         return float(s)
     except: return default
 
 
+def safe_float_series(values, default=np.nan):
+    """Vectorized safe_float over a column of raw cells; unparseable or non-finite cells become default."""
+    s   = pd.Series(values, dtype=object).astype(str).str.strip().str.replace(r"[$,%]", "", regex=True).str.lower()
+    out = pd.to_numeric(s.mask(s.isin(_FLOAT_NULLS)), errors="coerce").astype(float)
+    return out.where(np.isfinite(out), default)
+
+
 def convert_lead_time_to_days(val):
     """Exact port of source convert_lead_time_to_days."""
-    if val is None or (isinstance(val, float) and np.isnan(val)): return np.nan
-    if isinstance(val, (int, float)):
-        return int(round(val)) if not np.isinf(val) else np.nan
-    s = str(val).lower().strip()
-    if s in ['n/a','unknown','','na','none']: return np.nan
+    if val is None: return np.nan
+    if isinstance(val, _FLOAT_TYPES):
+        return int(round(val)) if isfinite(val) else np.nan
+    return _lead_time_text_days(str(val))
+
+
+@lru_cache(maxsize=1024)
+def _lead_time_text_days(text):
+    """String branch of convert_lead_time_to_days; supplier lead-time strings repeat heavily."""
+    s = text.lower().strip()
+    if s in _LT_NULLS: return np.nan
     if s == 'stock': return 0
     try:
-        m = re.search(r'(\d+(\.\d+)?)', s)
+        m = _LT_RE.search(s)
         if not m: return np.nan
         num = float(m.group(1))
         if 'week' in s: return int(round(num * 7))
@@ -91,128 +185,161 @@ def convert_lead_time_to_days(val):
     except: return np.nan
 
 
-def get_optimal_cost(qty_needed, pricing_breaks, min_order_qty=0, buy_up_threshold_pct=1.0):
+def _optimal_cost_kernel(qtys, prices, base_order_qty, buy_up_threshold_pct):
+    """
+    Numeric core of get_optimal_cost over parallel qty-sorted break arrays.
+    Returns (unit_price, total_cost, order_qty, moq_adjusted, note_kind, note_qty)
+    where note_kind is 0 (none), 1 (cheaper break) or 2 (bought up).
+    """
+    # Applicable break: last qty <= order qty
+    idx = int(np.searchsorted(qtys, base_order_qty, side="right")) - 1
+    moq_adjusted = idx < 0
+    if moq_adjusted:
+        idx = 0
+        base_order_qty = max(base_order_qty, qtys[0])
+
+    best_unit_price  = prices[idx]
+    best_total_cost  = best_unit_price * base_order_qty
+    actual_order_qty = base_order_qty
+    note_kind = 0; note_qty = 0
+    lower = 1.0 - (buy_up_threshold_pct / 100.0)
+    upper = 1.0 + (buy_up_threshold_pct / 100.0)
+
+    # Buy-up candidates: only breaks at or above the order qty. Their totals are one
+    # vector multiply; the walk itself stays sequential (each pick moves the bar for
+    # the next), but is skipped when no candidate is within reach of the current best.
+    start  = int(np.searchsorted(qtys, base_order_qty, side="left"))
+    totals = qtys[start:] * prices[start:]
+    if len(totals) and totals.min() <= best_total_cost * max(lower, upper):
+        for break_qty, price, total_cost_at_break in zip(qtys[start:].tolist(), prices[start:].tolist(),
+                                                         totals.tolist()):
+            if total_cost_at_break < best_total_cost * lower:
+                best_total_cost  = total_cost_at_break
+                best_unit_price  = price
+                actual_order_qty = break_qty
+                note_kind = 1; note_qty = break_qty
+            elif actual_order_qty < break_qty and total_cost_at_break <= best_total_cost * upper:
+                best_total_cost  = total_cost_at_break
+                best_unit_price  = price
+                actual_order_qty = break_qty
+                note_kind = 2; note_qty = break_qty
+
+    return best_unit_price, best_total_cost, actual_order_qty, moq_adjusted, note_kind, note_qty
+
+
+def _pricing_soa(breaks):
+    """
+    Pack (qty, price) pairs into the struct-of-arrays pricing layout used from the
+    supplier parsers through get_optimal_cost: {"qty": int64[], "price": float64[]}.
+    """
+    qtys, prices = zip(*breaks) if breaks else ((), ())
+    return {"qty": np.array(qtys, dtype=np.int64), "price": np.array(prices, dtype=np.float64)}
+
+
+def get_optimal_cost(qty_needed, pricing, min_order_qty=0, buy_up_threshold_pct=1.0):
     """
     Exact port of BOMAnalyzerApp.get_optimal_cost.
+    pricing is the {"qty": int64[], "price": float64[]} layout from _pricing_soa.
+    Validates/sorts the breaks with array masks, then runs _optimal_cost_kernel.
     Returns (unit_price, total_cost, actual_order_qty, notes)
     """
-    notes = ""
-    if not isinstance(qty_needed, (int,float)) or qty_needed <= 0:
+    if not isinstance(qty_needed, _FLOAT_TYPES) or qty_needed <= 0:
         return np.nan, np.nan, qty_needed, "Invalid Qty Needed"
-    if not isinstance(pricing_breaks, list):
+    if not isinstance(pricing, dict) or "qty" not in pricing or "price" not in pricing:
         return np.nan, np.nan, qty_needed, "Invalid Pricing Data"
 
     try:
-        valid_breaks = [
-            {'qty': int(pb['qty']), 'price': safe_float(pb['price'])}
-            for pb in pricing_breaks
-            if isinstance(pb, dict) and 'qty' in pb and 'price' in pb
-            and int(pb['qty']) > 0 and pd.notna(safe_float(pb['price']))
-            and safe_float(pb['price']) >= 0
-        ]
-        if not valid_breaks:
+        qtys   = np.asarray(pricing["qty"], dtype=np.int64)
+        prices = np.asarray(pricing["price"], dtype=np.float64)
+        valid  = (qtys > 0) & ~np.isnan(prices) & (prices >= 0)
+        if not valid.any():
             return np.nan, np.nan, qty_needed, "No Valid Price Breaks"
-        pricing_breaks = sorted(valid_breaks, key=lambda x: x['qty'])
-        min_order_qty  = max(1, int(safe_float(min_order_qty, default=1)))
+        qtys, prices  = qtys[valid], prices[valid]
+        order         = np.argsort(qtys, kind="stable")
+        qtys, prices  = qtys[order], prices[order]
+        min_order_qty = max(1, int(safe_float(min_order_qty, default=1)))
     except Exception as e:
         return np.nan, np.nan, qty_needed, f"Pricing Data Error: {e}"
 
     base_order_qty = max(int(qty_needed), min_order_qty)
 
-    base_unit_price = np.nan
-    applicable_break = None
-    for pb in pricing_breaks:
-        if base_order_qty >= pb['qty']:
-            applicable_break = pb
-        else:
-            break
-    if applicable_break:
-        base_unit_price = applicable_break['price']
-    elif pricing_breaks:
-        applicable_break = pricing_breaks[0]
-        base_unit_price  = applicable_break['price']
-        base_order_qty   = max(base_order_qty, applicable_break['qty'])
-        notes += f"MOQ adjusted to first break ({base_order_qty}). "
-    else:
-        return np.nan, np.nan, qty_needed, "Cannot Determine Base Price"
+    unit_price, total_cost, order_qty, moq_adjusted, note_kind, note_qty = \
+        _optimal_cost_kernel(qtys, prices, base_order_qty, buy_up_threshold_pct)
 
-    best_total_cost  = base_unit_price * base_order_qty
-    best_unit_price  = base_unit_price
-    actual_order_qty = base_order_qty
+    if note_kind == 1:   notes = f"Price break @ {note_qty} lower total cost."
+    elif note_kind == 2: notes = f"Bought up to {note_qty} for similar total cost."
+    elif moq_adjusted:   notes = f"MOQ adjusted to first break ({max(base_order_qty, qtys[0])})."
+    else:                notes = ""
+    return float(unit_price), float(total_cost), int(order_qty), notes
+
+
+def _norm_coo(coo):
+    """Canonical COO key (stripped, lower-case) — computed once per supplier response."""
+    return str(coo).strip().lower()
 
-    for pb in pricing_breaks:
-        break_qty   = pb['qty']
-        break_price = pb['price']
-        if break_qty >= base_order_qty:
-            total_cost_at_break = break_qty * break_price
-            if total_cost_at_break < best_total_cost * (1.0 - (buy_up_threshold_pct / 100.0)):
-                best_total_cost  = total_cost_at_break
-                best_unit_price  = break_price
-                actual_order_qty = break_qty
-                notes = f"Price break @ {break_qty} lower total cost. "
-            elif (actual_order_qty < break_qty and
-                  total_cost_at_break <= best_total_cost * (1.0 + (buy_up_threshold_pct / 100.0))):
-                best_total_cost  = total_cost_at_break
-                best_unit_price  = break_price
-                actual_order_qty = break_qty
-                notes = f"Bought up to {break_qty} for similar total cost. "
 
-    return best_unit_price, best_total_cost, actual_order_qty, notes.strip()
+def _geo_risk(coo_lower):
+    """
+    Geographic risk for one normalized COO (see _norm_coo). Exact country names and
+    ISO2 codes are a single dict hit; anything else falls back to the first tier
+    country found in it.
+    """
+    score = _GEO_EXACT.get(coo_lower)
+    if score is not None: return score
+    return next((v for k, v in _GEO_LOWER.items() if k in coo_lower), _GEO_DEFAULT)
 
 
-def calculate_risk_score(sourcing_count, stock_available, qty_needed,
-                         lead_time_days, lifecycle_notes, coo):
+def calculate_risk_scores(risk_inputs):
     """
-    Exact port of source risk factor logic from analyze_single_part.
-    Returns (overall_score 0-10, risk_factors dict)
+    Vectorized port of source risk factor logic from analyze_single_part, scoring
+    a whole BOM at once. risk_inputs is a DataFrame with one row per part and
+    columns sourcing_count, stock_available, qty_needed, lead_time_days,
+    lifecycle, coo (normalized with _norm_coo).
+    Returns (overall ndarray 0-10, risk_factors DataFrame keyed like RISK_WEIGHTS)
     """
-    risk_factors = {}
+    n     = risk_inputs["sourcing_count"].to_numpy()
+    stock = risk_inputs["stock_available"].to_numpy(dtype=float)
+    qty   = risk_inputs["qty_needed"].to_numpy(dtype=float)
+    lt    = risk_inputs["lead_time_days"].to_numpy(dtype=float)
+    risk_factors = pd.DataFrame(index=risk_inputs.index)
 
     # Sourcing risk  (0, 4, 7, 10)
-    if sourcing_count == 0:   risk_factors['Sourcing'] = 10
-    elif sourcing_count == 1: risk_factors['Sourcing'] = 7
-    elif sourcing_count == 2: risk_factors['Sourcing'] = 4
-    else:                     risk_factors['Sourcing'] = 0
+    risk_factors["Sourcing"] = np.select([n == 0, n == 1, n == 2], [10, 7, 4], default=0)
 
     # Stock risk
-    has_stock_gap = (stock_available < qty_needed)
-    if has_stock_gap:                                    risk_factors['Stock'] = 8
-    elif stock_available < 1.5 * qty_needed:             risk_factors['Stock'] = 4
-    else:                                                risk_factors['Stock'] = 0
+    risk_factors["Stock"] = np.select([stock < qty, stock < 1.5 * qty], [8, 4], default=0)
 
     # Lead time risk (based on fastest available)
-    lt = lead_time_days
-    if pd.isna(lt) or lt == np.inf:       risk_factors['LeadTime'] = 9
-    elif lt == 0:                          risk_factors['LeadTime'] = 0
-    elif lt > 90:                          risk_factors['LeadTime'] = 7
-    elif lt > 45:                          risk_factors['LeadTime'] = 4
-    else:                                  risk_factors['LeadTime'] = 1
+    risk_factors["LeadTime"] = np.select(
+        [np.isnan(lt) | np.isinf(lt), lt == 0, lt > 90, lt > 45], [9, 0, 7, 4], default=1)
 
     # Lifecycle risk
-    lc = str(lifecycle_notes).upper()
-    if "EOL" in lc or "DISC" in lc:       risk_factors['Lifecycle'] = 10
-    else:                                  risk_factors['Lifecycle'] = 0
-
-    # Geographic risk
-    # Try to match country name from COO string
-    coo_str = str(coo).strip()
-    geo_score = GEO_RISK_TIERS.get("_DEFAULT_", 4)
-    for country, score in GEO_RISK_TIERS.items():
-        if country.lower() in coo_str.lower():
-            geo_score = score
-            break
-    risk_factors['Geographic'] = geo_score
-
-    overall = sum(risk_factors[f] * RISK_WEIGHTS[f] for f in RISK_WEIGHTS)
-    overall = round(max(0.0, min(10.0, overall)), 1)
+    lc = risk_inputs["lifecycle"].astype(str)
+    risk_factors["Lifecycle"] = np.where(lc.str.contains(_LC_RISK_RE), 10, 0)
+
+    # Geographic risk — substring match, evaluated once per distinct COO
+    coo = risk_inputs["coo"]
+    risk_factors["Geographic"] = coo.map({c: _geo_risk(c) for c in coo.unique()})
+
+    # Accumulate in RISK_WEIGHTS order and use Python round() on the distinct
+    # totals so scores match the scalar port bit-for-bit
+    overall = np.zeros(len(risk_inputs))
+    for f, w in RISK_WEIGHTS.items():
+        overall = overall + risk_factors[f].to_numpy() * w
+    overall = np.clip(overall, 0.0, 10.0)
+    uniq, inv = np.unique(overall, return_inverse=True)
+    overall = np.array([round(float(v), 1) for v in uniq])[inv]
     return overall, risk_factors
 
 
-def get_tariff_rate(coo, custom_tariffs):
-    """Map COO to tariff rate using custom tariff table or defaults."""
-    coo_str = str(coo).strip().lower()
+def get_tariff_rate(coo_lower, custom_tariffs):
+    """
+    Map a normalized COO (see _norm_coo) to tariff rate using custom tariff table or defaults.
+    custom_tariffs keys must already be lower-case (analyze_bom lowers them once per BOM).
+    """
+    coo_str = _ISO_TO_NAME.get(coo_lower, coo_lower)
     for country, rate in custom_tariffs.items():
-        if country.lower() in coo_str:
+        if country in coo_str:
             return rate
     # Default tariff
     if "china" in coo_str or "cn" == coo_str: return 0.25
@@ -245,24 +372,19 @@ def clean_part_number(pn):
 
     # Remove PBFREE / PB-FREE / PB FREE suffix (RoHS marker, not part of MPN)
     # Important: Do NOT strip #PBF from ADI/LTC parts — it IS part of their MPN
-    pbfree_variants = [" PBFREE", "-PBFREE", "_PBFREE", " PB-FREE", "-PB-FREE", " PB FREE"]
     p_upper = p.upper()
-    for suffix in pbfree_variants:
-        if p_upper.endswith(suffix):
-            p = p[:len(p) - len(suffix)].strip(" -_")
-            changes.append(f"removed '{suffix.strip()}' suffix")
-            break
+    if p_upper.endswith(_PBFREE_SUFFIXES):
+        suffix = next(x for x in _PBFREE_SUFFIXES if p_upper.endswith(x))
+        p = p[:len(p) - len(suffix)].strip(" -_")
+        changes.append(f"removed '{suffix.strip()}' suffix")
 
     # Remove common distributor/packaging suffixes that aren't part of the base MPN
     # Exception: #PBF is kept because ADI/LTC use it as part of their official MPN
-    dist_suffixes = ["-ND", "-1-ND", "-2-ND", "-TR", "-T&R", "-TRC",
-                     "-CT", "-CUT", "-REEL", "/T", "-T"]
     p_upper = p.upper()
-    for suffix in dist_suffixes:
-        if p_upper.endswith(suffix.upper()):
-            p = p[:len(p) - len(suffix)].strip(" -_")
-            changes.append(f"removed distributor suffix '{suffix}'")
-            break
+    if p_upper.endswith(_DIST_SUFFIXES):
+        suffix = next(x for x in _DIST_SUFFIXES if p_upper.endswith(x))
+        p = p[:len(p) - len(suffix)].strip(" -_")
+        changes.append(f"removed distributor suffix '{suffix}'")
 
     # Final whitespace cleanup
     p_clean = p.strip()
@@ -274,35 +396,114 @@ def clean_part_number(pn):
 
 # ── API Functions ─────────────────────────────────────────────────────────────
 
-def search_mouser(part_number, api_key):
-    """Fetch from Mouser API. Returns standardized result dict or None."""
-    if not api_key: return None
+class _NoSupplierData(Exception):
+    """Raised inside cached lookups so misses and failures are never memoized."""
+
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket. acquire() reserves a token and sleeps until it is due,
+    so concurrent workers queue up at rate/s instead of tripping supplier 429s.
+    """
+    def __init__(self, rate, burst):
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = float(burst)
+        self.stamp  = time.monotonic()
+        self.lock   = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate) - 1
+            self.stamp  = now
+            wait = -self.tokens / self.rate
+        if wait > 0: time.sleep(wait)
+
+
+@st.cache_resource
+def _rate_limiter(supplier, key_digest):
+    """One bucket per (supplier, API key) — quotas are per key — shared across threads and sessions."""
+    return _TokenBucket(RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+
+
+def _post_json(url, payload, headers=None, **kwargs):
+    """POST payload as an orjson-encoded body on the shared session."""
+    return _HTTP.post(url, data=orjson.dumps(payload),
+                      headers={"Content-Type": "application/json", **(headers or {})}, **kwargs)
+
+
+def _key_digest(*secrets):
+    """Short digest of API credentials — used as a cache key so raw keys never are."""
+    return hashlib.blake2b("|".join(secrets).encode(), digest_size=8).hexdigest()
+
+
+def _mouser_request(query, api_key):
+    """One Mouser part-number search. Returns the Parts list ([] if none), or None on failure."""
     url    = "https://api.mouser.com/api/v1/search/partnumber"
     params = {"apiKey": api_key}
-    payload= {"SearchByPartRequest": {"mouserPartNumber": part_number, "partSearchOptions": "string"}}
+    payload= {"SearchByPartRequest": {"mouserPartNumber": query, "partSearchOptions": "Exact"}}
     try:
-        r     = requests.post(url, params=params, json=payload, timeout=API_TIMEOUT)
+        _rate_limiter("mouser", _key_digest(api_key)).acquire()
+        r     = _post_json(url, payload, params=params, timeout=API_TIMEOUT)
         r.raise_for_status()
-        data  = r.json()
-        parts = data.get("SearchResults", {}).get("Parts", [])
-        if not parts: return None
-        p = parts[0]
+        return orjson.loads(r.content).get("SearchResults", {}).get("Parts", []) or []
+    except: return None
+
 
+def _search_mouser_uncached(part_numbers, api_key):
+    """
+    Fetch up to MOUSER_BATCH_SIZE part numbers from Mouser, pipe-joined into one request.
+    Every part resolves the same way regardless of batch size: a batch result is kept
+    only on an exact part-number match, and anything else (or any part number that
+    itself contains "|") gets the single-part request, which takes the first hit.
+    Returns {part_number: standardized result dict}; parts with no match are absent.
+    """
+    matched = {}
+    singles = [pn for pn in part_numbers if "|" in pn]
+    batch   = [pn for pn in part_numbers if "|" not in pn]
+    if len(batch) > 1:
+        parts = _mouser_request("|".join(batch), api_key)
+        if parts is None: batch = []     # request failed — don't retry each part now
+        # Results come back in no particular order: match on either part number
+        wanted = {pn.upper(): pn for pn in batch}
+        for p in parts or []:
+            for field in ("ManufacturerPartNumber", "MouserPartNumber"):
+                pn = wanted.get(str(p.get(field, "")).upper())
+                if pn is not None:
+                    matched.setdefault(pn, p)
+                    break
+        singles += [pn for pn in batch if pn not in matched]
+    else:
+        singles += batch
+    for pn in singles:
+        parts = _mouser_request(pn, api_key)
+        if parts: matched[pn] = parts[0]
+    found = {}
+    for pn, p in matched.items():
+        result = _parse_mouser_part(p, pn)
+        if result is not None: found[pn] = result
+    return found
+
+
+def _parse_mouser_part(p, part_number):
+    """Standardize one Mouser SearchResults part. Returns result dict or None."""
+    try:
         price_breaks = []
         for pb in p.get("PriceBreaks", []):
             try:
                 qty   = int(pb.get("Quantity", 0))
                 price = safe_float(str(pb.get("Price","0")).replace("$","").replace(",",""))
-                if qty > 0 and pd.notna(price) and price > 0:
-                    price_breaks.append({"qty": qty, "price": price})
+                if qty > 0 and price == price and price > 0:
+                    price_breaks.append((qty, price))
             except: continue
 
         raw_lt  = p.get("LeadTime", "")
         lt_days = convert_lead_time_to_days(raw_lt)
 
-        eol  = p.get("LifecycleStatus","").upper()
-        is_eol  = any(x in eol for x in ["OBSOLETE","EOL","DISCONTINUED","NOT RECOMMENDED"])
-        is_disc = "DISCONTINUED" in eol
+        eol  = p.get("LifecycleStatus","")
+        is_eol  = bool(_EOL_RE.search(eol))
+        is_disc = bool(_DISC_RE.search(eol))
 
         return {
             "Source":                 "Mouser",
@@ -313,8 +514,9 @@ def search_mouser(part_number, api_key):
             "Stock":                  int(safe_float(p.get("AvailabilityInStock",0), default=0)),
             "LeadTimeDays":           lt_days,
             "MinOrderQty":            int(safe_float(p.get("Min","1"), default=1)),
-            "Pricing":                price_breaks,
+            "Pricing":                _pricing_soa(price_breaks),
             "CountryOfOrigin":        p.get("CountryOfOrigin","Unknown"),
+            "_coo_lower":             _norm_coo(p.get("CountryOfOrigin","Unknown")),
             "NormallyStocking":       True,
             "Discontinued":           is_disc,
             "EndOfLife":              is_eol,
@@ -324,85 +526,114 @@ def search_mouser(part_number, api_key):
         return None
 
 
-def search_nexar(part_number, client_id, client_secret, _token_cache):
-    """Fetch from Nexar (Octopart) GraphQL API. Returns standardized result dict or None."""
-    if not client_id or not client_secret: return None
-
-    # Token handling with simple in-memory cache passed as mutable dict
-    now = time.time()
-    if _token_cache.get("expires_at", 0) > now + 60:
-        token = _token_cache["access_token"]
-    else:
-        try:
-            tr = requests.post("https://identity.nexar.com/connect/token",
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-                data={"grant_type":"client_credentials","client_id":client_id,
-                      "client_secret":client_secret,"scope":"supply.domain"},
-                timeout=API_TIMEOUT)
-            tr.raise_for_status()
-            td = tr.json()
-            token = td.get("access_token")
-            if not token: return None
-            _token_cache["access_token"] = token
-            _token_cache["expires_at"]   = now + td.get("expires_in", 3600) - 60
-        except: return None
-
-    query = """
-    query Search($q: String!) {
-      supSearch(q: $q, limit: 1) {
-        hits {
-          part {
-            mpn
-            shortDescription
-            manufacturer { name }
-            bestDatasheet { url }
-            sellers(includeBrokers: false) {
-              company { name }
-              offers {
-                sku
-                inventoryLevel
-                moq
-                factoryLeadDays
-                packaging
-                prices { quantity price currency }
-              }
-            }
+# Per-part selection set; a batch request aliases one supSearch per part number.
+# Documents are parameterized and built once per batch size, so part numbers only
+# ever travel as variables and the server sees the same few documents.
+_NEXAR_PART_FIELDS = """{
+    hits {
+      part {
+        mpn
+        shortDescription
+        manufacturer { name }
+        bestDatasheet { url }
+        sellers(includeBrokers: false) {
+          company { name }
+          offers {
+            sku
+            inventoryLevel
+            moq
+            factoryLeadDays
+            packaging
+            prices { quantity price currency }
           }
         }
       }
-    }"""
+    }
+  }"""
+
+
+@lru_cache(maxsize=NEXAR_BATCH_SIZE)
+def _nexar_query(n):
+    """GraphQL document searching n part numbers ($q0..) under aliases r0.."""
+    params = ", ".join(f"$q{i}: String!" for i in range(n))
+    fields = "\n".join(f"  r{i}: supSearch(q: $q{i}, limit: 1) {_NEXAR_PART_FIELDS}" for i in range(n))
+    return f"query Search({params}) {{\n{fields}\n}}"
+
+
+@st.cache_resource(ttl=3300, show_spinner=False)
+def _nexar_token(client_id, client_secret):
+    """
+    Fetch a Nexar OAuth bearer token. Cached process-wide (all runs, all sessions)
+    until shortly before the 1h expiry. Raises on failure so nothing bad is cached.
+    cache_resource computes under a per-key lock with double-checked lookup, so
+    concurrent workers on a cold cache make one identity request between them and
+    warm lookups take no lock at all.
+    """
+    tr = _HTTP.post("https://identity.nexar.com/connect/token",
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        data={"grant_type":"client_credentials","client_id":client_id,
+              "client_secret":client_secret,"scope":"supply.domain"},
+        timeout=API_TIMEOUT)
+    tr.raise_for_status()
+    token = orjson.loads(tr.content).get("access_token")
+    if not token:
+        raise ValueError("Nexar token response missing access_token")
+    return token
+
+
+def _search_nexar_uncached(part_numbers, client_id, client_secret):
+    """
+    Fetch up to NEXAR_BATCH_SIZE part numbers from Nexar (Octopart) GraphQL in one request.
+    Returns {part_number: standardized result dict}; parts with no usable offer are absent.
+    """
+    try:    token = _nexar_token(client_id, client_secret)
+    except: return {}
+
     try:
-        r = requests.post("https://api.nexar.com/graphql",
-            json={"query": query, "variables": {"q": part_number}},
+        _rate_limiter("nexar", _key_digest(client_id, client_secret)).acquire()
+        r = _post_json("https://api.nexar.com/graphql",
+            {"query": _nexar_query(len(part_numbers)), "operationName": "Search",
+             "variables": {f"q{i}": pn for i, pn in enumerate(part_numbers)}},
             headers={"Authorization": f"Bearer {token}"},
             timeout=API_TIMEOUT)
         r.raise_for_status()
-        hits = r.json().get("data",{}).get("supSearch",{}).get("hits",[])
-        if not hits: return None
+        data = orjson.loads(r.content).get("data") or {}
+    except: return {}
+
+    found = {}
+    for i, pn in enumerate(part_numbers):
+        hits = (data.get(f"r{i}") or {}).get("hits") or []
+        result = _parse_nexar_part(hits[0]["part"], pn) if hits else None
+        if result is not None: found[pn] = result
+    return found
 
-        part_data = hits[0]["part"]
+
+def _parse_nexar_part(part_data, part_number):
+    """Standardize one Nexar part: its cheapest USD offer. Returns result dict or None."""
+    try:
         best_offer = None; best_price = float('inf'); best_seller = ""
 
         for seller in part_data.get("sellers", []):
             for offer in seller.get("offers", []):
                 usd_prices = [p for p in offer.get("prices",[]) if p.get("currency") == "USD"]
                 if usd_prices:
-                    min_p = min(safe_float(p["price"]) for p in usd_prices if pd.notna(safe_float(p["price"])))
-                    if pd.notna(min_p) and min_p < best_price:
+                    min_p = min(x for x in map(safe_float, (p["price"] for p in usd_prices)) if x == x)
+                    if min_p < best_price:
                         best_price  = min_p
                         best_offer  = offer
                         best_seller = seller.get("company",{}).get("name","")
 
         if not best_offer: return None
 
-        pricing = sorted([
-            {"qty": int(p["quantity"]), "price": safe_float(p["price"])}
+        pricing = _pricing_soa(sorted([
+            (int(p["quantity"]), price)
             for p in best_offer.get("prices",[])
-            if p.get("currency") == "USD" and pd.notna(safe_float(p.get("price")))
-        ], key=lambda x: x["qty"])
+            if p.get("currency") == "USD" and (price := safe_float(p.get("price"))) == price
+        ], key=lambda x: x[0]))
 
         lt_raw  = best_offer.get("factoryLeadDays")
-        lt_days = int(safe_float(lt_raw)) if pd.notna(safe_float(lt_raw)) else np.nan
+        lt_num  = safe_float(lt_raw)
+        lt_days = int(lt_num) if lt_num == lt_num else np.nan
 
         return {
             "Source":                 best_seller or "Octopart (Nexar)",
@@ -415,6 +646,7 @@ def search_nexar(part_number, client_id, client_secret, _token_cache):
             "MinOrderQty":            int(safe_float(best_offer.get("moq",1), default=1)),
             "Pricing":                pricing,
             "CountryOfOrigin":        "Unknown",
+            "_coo_lower":             "unknown",
             "NormallyStocking":       True,
             "Discontinued":           False,
             "EndOfLife":              False,
@@ -423,68 +655,136 @@ def search_nexar(part_number, client_id, client_secret, _token_cache):
     except: return None
 
 
-def get_part_data_parallel(part_number, mouser_key, nexar_id, nexar_secret, nexar_token_cache):
-    """Fetch from all enabled suppliers in parallel. Returns dict of {supplier: result}."""
-    results = {}
-    tasks   = {}
+class _DiskCache:
+    """Small sqlite-backed TTL cache (stdlib only) so supplier results survive restarts."""
+    def __init__(self, path, ttl):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl  = ttl
+        self.lock = threading.Lock()
+        self.db   = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value BLOB)")
+        self.db.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="API") as ex:
-        if mouser_key:
-            tasks[ex.submit(search_mouser, part_number, mouser_key)] = "Mouser"
-        if nexar_id and nexar_secret:
-            tasks[ex.submit(search_nexar, part_number, nexar_id, nexar_secret, nexar_token_cache)] = "Nexar"
+    # get/set are best-effort: a locked, full or corrupt database is a miss / no-op,
+    # never an error that could drop freshly fetched results
+    def get(self, key):
+        try:
+            with self.lock:
+                row = self.db.execute("SELECT expires, value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] < time.time(): return None
+            return pickle.loads(row[1])
+        except Exception: return None
 
-        for future in as_completed(tasks, timeout=30):
-            name = tasks[future]
-            try:
-                result = future.result()
-                if result and isinstance(result, dict):
-                    results[name] = result
-            except: pass
-    return results
+    def set(self, key, value):
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            with self.lock:
+                self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, time.time() + self.ttl, blob))
+        except Exception: pass
 
+    def clear(self):
+        """Delete every entry. Returns False if the database could not be written."""
+        try:
+            with self.lock:
+                self.db.execute("DELETE FROM cache")
+            return True
+        except Exception: return False
+
+
+@st.cache_resource
+def _supplier_disk_cache():
+    """Process-wide disk cache, or None when the app directory is not writable."""
+    try: return _DiskCache(os.path.join(DISK_CACHE_DIR, "suppliers.sqlite"), DISK_CACHE_TTL)
+    except Exception: return None
 
-def analyze_single_part(bom_pn, bom_mfg, bom_qty_per_unit, config,
-                        mouser_key, nexar_id, nexar_secret, nexar_token_cache):
+
+def _disk_cached_batch(supplier, part_numbers, key_digest, fetch):
     """
-    Core single-part analysis. Faithful port of BOMAnalyzerApp.analyze_single_part.
-    Returns dict with all fields for display and strategy engine.
+    Second level under st.cache_data: disk hits per part, then one fetch(todo) for
+    the rest (stored on success). Any miss raises (carrying what was found) so the
+    batch isn't memoized and the miss is retried next run.
     """
-    total_units       = config.get("total_units", 100)
-    buy_up_pct        = config.get("buy_up_threshold", 1.0)
-    custom_tariffs    = config.get("custom_tariff_rates", {})
-    total_qty_needed  = int(bom_qty_per_unit * total_units)
+    disk  = _supplier_disk_cache()
+    keys  = {pn: f"{supplier}|{key_digest}|{pn}" for pn in part_numbers}
+    found = {pn: hit for pn in part_numbers if disk and (hit := disk.get(keys[pn])) is not None}
+    todo  = tuple(pn for pn in part_numbers if pn not in found)
+    if todo:
+        fetched = fetch(todo)
+        if disk:
+            for pn, result in fetched.items(): disk.set(keys[pn], result)
+        found.update(fetched)
+    if len(found) < len(part_numbers): raise _NoSupplierData(found)
+    return found
 
-    # Fetch data
-    supplier_data = get_part_data_parallel(bom_pn, mouser_key, nexar_id, nexar_secret, nexar_token_cache)
 
-    # No data found case
-    if not supplier_data:
-        return {
-            "PartNumber": bom_pn, "Manufacturer": bom_mfg or "N/A",
-            "MfgPN": bom_pn, "QtyNeed": total_qty_needed,
-            "Status": "Not Found", "Sources": "0", "StockAvail": 0,
-            "COO": "Unknown", "RiskScore": 10.0, "TariffPct": "N/A",
-            "BestCostPer": "N/A", "BestTotalCost": "N/A", "ActualBuyQty": "N/A",
-            "BestCostLT": "N/A", "BestCostSrc": "N/A",
-            "Description": "No supplier data — check API keys",
-            "Notes": "No data", "_options": [], "_valid": False,
-        }
+@st.cache_data(ttl=3600, max_entries=SUPPLIER_CACHE_ENTRIES, show_spinner=False)
+def _search_mouser_cached(part_numbers, key_digest, _api_key):
+    return _disk_cached_batch("mouser", part_numbers, key_digest,
+                              lambda todo: _search_mouser_uncached(todo, _api_key))
+
+
+@st.cache_data(ttl=3600, max_entries=SUPPLIER_CACHE_ENTRIES, show_spinner=False)
+def _search_nexar_cached(part_numbers, key_digest, _client_id, _client_secret):
+    return _disk_cached_batch("nexar", part_numbers, key_digest,
+                              lambda todo: _search_nexar_uncached(todo, _client_id, _client_secret))
+
+
+def clear_supplier_cache():
+    """Drop every memoized and on-disk supplier result. False if the disk layer couldn't be cleared."""
+    _search_mouser_cached.clear()
+    _search_nexar_cached.clear()
+    disk = _supplier_disk_cache()
+    return disk.clear() if disk else True
 
-    # Build options list
+
+def search_mouser(part_numbers, api_key, refresh=False):
+    """
+    Mouser lookup for a batch of part numbers, memoized for 1h per batch (and 6h per
+    part on disk). Returns {part_number: result}. Misses are retried on the next run.
+    refresh=True skips both cache levels for this call only.
+    """
+    if not api_key: return {}
+    if refresh: return _search_mouser_uncached(tuple(part_numbers), api_key)
+    try:
+        return _search_mouser_cached(tuple(part_numbers), _key_digest(api_key), api_key)
+    except _NoSupplierData as e:
+        return e.args[0]
+
+
+def search_nexar(part_numbers, client_id, client_secret, refresh=False):
+    """
+    Nexar lookup for a batch of part numbers, memoized for 1h per batch (and 6h per
+    part on disk). Returns {part_number: result}. Misses are retried on the next run.
+    refresh=True skips both cache levels for this call only.
+    """
+    if not client_id or not client_secret: return {}
+    if refresh: return _search_nexar_uncached(tuple(part_numbers), client_id, client_secret)
+    try:
+        return _search_nexar_cached(tuple(part_numbers), _key_digest(client_id, client_secret),
+                                    client_id, client_secret)
+    except _NoSupplierData as e:
+        return e.args[0]
+
+
+def _with_script_ctx(ctx, fn, *args):
+    """Run fn on a pool thread under the caller's script context (st.cache_* needs one)."""
+    add_script_run_ctx(threading.current_thread(), ctx)
+    return fn(*args)
+
+
+def build_options(supplier_data, bom_pn, bom_mfg, total_qty_needed, buy_up_pct):
+    """Price every pre-fetched supplier result for total_qty_needed. Returns list of option dicts."""
     all_options = []
     for src_name, sd in supplier_data.items():
-        pricing = sd.get("Pricing", [])
+        pricing = sd.get("Pricing", _pricing_soa([]))
         moq     = sd.get("MinOrderQty", 1)
         unit_p, total_c, act_qty, notes = get_optimal_cost(
             total_qty_needed, pricing, moq, buy_up_pct
         )
         stock   = sd.get("Stock", 0)
         lt_days = sd.get("LeadTimeDays", np.nan)
-        if isinstance(lt_days, float) and np.isnan(lt_days):
-            effective_lt = np.inf
-        else:
-            effective_lt = 0 if stock >= total_qty_needed else (lt_days if pd.notna(lt_days) else np.inf)
+        lead_time    = lt_days if lt_days == lt_days else np.inf
+        effective_lt = np.inf if lt_days != lt_days else (0 if stock >= total_qty_needed else lt_days)
 
         all_options.append({
             "source":          sd.get("Source", src_name),
@@ -493,13 +793,14 @@ def analyze_single_part(bom_pn, bom_mfg, bom_qty_per_unit, config,
             "Manufacturer":    sd.get("Manufacturer", bom_mfg or "N/A"),
             "Description":     sd.get("Description",""),
             "stock":           stock,
-            "lead_time":       lt_days if pd.notna(lt_days) else np.inf,
+            "lead_time":       lead_time,
             "effective_lead":  effective_lt,
             "unit_cost":       unit_p,
             "cost":            total_c,
             "actual_order_qty": act_qty,
             "notes":           notes,
             "coo":             sd.get("CountryOfOrigin","Unknown"),
+            "coo_lower":       sd.get("_coo_lower") or _norm_coo(sd.get("CountryOfOrigin","Unknown")),
             "eol":             sd.get("EndOfLife", False),
             "discontinued":    sd.get("Discontinued", False),
             "lifecycle":       "EOL" if sd.get("EndOfLife") else ("DISC" if sd.get("Discontinued") else "Active"),
@@ -509,53 +810,64 @@ def analyze_single_part(bom_pn, bom_mfg, bom_qty_per_unit, config,
             "bom_pn":          bom_pn,
             "total_qty_needed": total_qty_needed,
         })
+    return all_options
 
-    # Consolidate COO, lifecycle
-    consolidated_coo = "Unknown"
-    for opt in all_options:
-        if opt["coo"] not in ("Unknown","N/A",""):
-            consolidated_coo = opt["coo"]
-            break
 
-    lifecycle_notes = ""
+def pick_best(all_options, total_qty_needed):
+    """
+    Returns (valid_options, best_cost_option, fastest_option) for one part's options.
+    One pass over the options; ties keep the earliest option, as min() did.
+    """
+    valid_options = []
+    best_cost_option = best_in_stock = best_lead = None
+    for o in all_options:
+        cost = o.get("cost", np.inf)
+        # Valid options (have pricing); best cost = lowest total cost
+        if isfinite(cost):
+            valid_options.append(o)
+            if best_cost_option is None or cost < best_cost_option.get("cost", np.inf):
+                best_cost_option = o
+        # Fastest: cheapest option that covers the qty from stock, else shortest lead time
+        if o.get("stock",0) >= total_qty_needed:
+            if best_in_stock is None or cost < best_in_stock.get("cost", np.inf):
+                best_in_stock = o
+        if o.get("lead_time", np.inf) != np.inf:
+            if best_lead is None or o.get("lead_time", np.inf) < best_lead.get("lead_time", np.inf):
+                best_lead = o
+
+    fastest_option = best_in_stock if best_in_stock is not None else best_lead
+    return valid_options, best_cost_option, fastest_option
+
+
+def format_row(bom_pn, bom_mfg, total_qty_needed, all_options, valid_options,
+               best_cost_option, fastest_option, custom_tariffs):
+    """Assemble the result row (display fields, risk inputs, tariff) for one analyzed part."""
+    # Consolidate COO (first supplier that reports one), lifecycle
+    coo_opt = next((o for o in all_options if o["coo"] not in ("Unknown","N/A","")), None)
+    consolidated_coo       = coo_opt["coo"]       if coo_opt else "Unknown"
+    consolidated_coo_lower = coo_opt["coo_lower"] if coo_opt else "unknown"
+
+    lifecycle_notes = ""; total_stock = 0
     for opt in all_options:
+        total_stock += opt.get("stock",0)
         if opt.get("eol"):         lifecycle_notes = "EOL"
         elif opt.get("discontinued"): lifecycle_notes = "DISC" if not lifecycle_notes else lifecycle_notes
 
-    # Valid options (have pricing)
-    valid_options = [o for o in all_options if pd.notna(o.get("cost")) and o.get("cost", np.inf) != np.inf]
-
-    # Best cost option (lowest total cost)
-    best_cost_option = min(valid_options, key=lambda o: o.get("cost", np.inf)) if valid_options else None
-
-    # Fastest option (lowest effective lead time then cost)
-    fastest_option = None
-    if all_options:
-        in_stock = [o for o in all_options if o.get("stock",0) >= total_qty_needed]
-        if in_stock:
-            fastest_option = min(in_stock, key=lambda o: o.get("cost", np.inf))
-        else:
-            with_lt = [o for o in all_options if o.get("lead_time", np.inf) != np.inf]
-            if with_lt:
-                fastest_option = min(with_lt, key=lambda o: o.get("lead_time", np.inf))
-
-    total_stock = sum(o.get("stock",0) for o in all_options)
-
     # Risk scoring
     fastest_lt = fastest_option.get("lead_time", np.inf) if fastest_option else np.inf
-    if isinstance(fastest_lt, float) and np.isinf(fastest_lt): fastest_lt_days = np.nan
-    else: fastest_lt_days = fastest_lt
-
-    risk_score, risk_factors = calculate_risk_score(
-        sourcing_count   = len(valid_options),
-        stock_available  = total_stock,
-        qty_needed       = total_qty_needed,
-        lead_time_days   = fastest_lt_days,
-        lifecycle_notes  = lifecycle_notes,
-        coo              = consolidated_coo,
-    )
+    fastest_lt_days = np.nan if fastest_lt == np.inf else fastest_lt
+
+    # Scored BOM-wide by score_bom_risk once every part is analyzed
+    risk_inputs = {
+        "sourcing_count":  len(valid_options),
+        "stock_available": total_stock,
+        "qty_needed":      total_qty_needed,
+        "lead_time_days":  fastest_lt_days,
+        "lifecycle":       lifecycle_notes,
+        "coo":             consolidated_coo_lower,
+    }
 
-    tariff_rate = get_tariff_rate(consolidated_coo, custom_tariffs)
+    tariff_rate = get_tariff_rate(consolidated_coo_lower, custom_tariffs)
 
     status = "Active"
     if "EOL" in lifecycle_notes: status = "EOL"
@@ -568,7 +880,7 @@ def analyze_single_part(bom_pn, bom_mfg, bom_qty_per_unit, config,
     # Best cost unit price with tariff
     bc_unit  = best_cost_option.get("unit_cost", np.nan) if best_cost_option else np.nan
     bc_total = best_cost_option.get("cost", np.nan) if best_cost_option else np.nan
-    bc_qty   = best_cost_option.get("actual_order_qty","N/A") if best_cost_option else "N/A"
+    bc_qty   = best_cost_option.get("actual_order_qty", np.nan) if best_cost_option else np.nan
     bc_lt    = best_cost_option.get("lead_time", np.inf) if best_cost_option else np.inf
     bc_src   = best_cost_option.get("source","N/A") if best_cost_option else "N/A"
 
@@ -580,40 +892,139 @@ def analyze_single_part(bom_pn, bom_mfg, bom_qty_per_unit, config,
         "MfgPN":         (best_cost_option or {}).get("ManufacturerPartNumber", bom_pn),
         "QtyNeed":       total_qty_needed,
         "Status":        status,
-        "Sources":       str(len(valid_options)),
+        "Sources":       len(valid_options),
         "StockAvail":    total_stock,
         "COO":           consolidated_coo,
-        "TariffPct":     f"{tariff_rate*100:.1f}%",
         "TariffRate":    tariff_rate,
-        "RiskScore":     risk_score,
-        "RiskFactors":   risk_factors,
-        "BestCostPer":   f"{bc_unit:.4f}" if pd.notna(bc_unit) else "N/A",
+        "RiskScore":     np.nan,
         "BestCostPerRaw": bc_unit,
-        "BestTotalCost": f"{bc_total:.2f}" if pd.notna(bc_total) else "N/A",
         "BestTotalCostRaw": bc_total,
-        "BestTotalWithTariff": (bc_total * (1 + tariff_rate)) if pd.notna(bc_total) else np.nan,
-        "ActualBuyQty":  str(bc_qty),
-        "BestCostLT":    f"{bc_lt:.0f}" if (pd.notna(bc_lt) and not np.isinf(bc_lt)) else ("0" if total_stock >= total_qty_needed else "N/A"),
+        "BestTotalWithTariff": bc_total * (1 + tariff_rate),
+        "ActualBuyQty":  bc_qty,
+        "BestCostLT":    float(bc_lt) if isfinite(bc_lt) else (0.0 if total_stock >= total_qty_needed else np.nan),
         "BestCostSrc":   bc_src,
         "Description":   desc,
         "Notes":         "; ".join(notes_list),
         "DatasheetUrl":  (best_cost_option or {}).get("DatasheetUrl",""),
         "_options":      all_options,
         "_valid":        bool(valid_options),
+        "_risk_inputs":  risk_inputs,
     }
 
 
+def analyze_single_part(bom_pn, bom_mfg, bom_qty_per_unit, supplier_data, *,
+                        total_units, buy_up_pct, custom_tariffs):
+    """
+    Core single-part analysis. Faithful port of BOMAnalyzerApp.analyze_single_part,
+    staged as build_options → pick_best → format_row.
+    supplier_data is the pre-fetched {supplier: result} dict — no I/O happens here.
+    Per-BOM settings are keyword-only so analyze_bom can bind them once with partial.
+    Returns dict with all fields for display and strategy engine.
+    """
+    total_qty_needed = int(bom_qty_per_unit * total_units)
+
+    # No data found case
+    if not supplier_data:
+        return {
+            "PartNumber": bom_pn, "Manufacturer": bom_mfg or "N/A",
+            "MfgPN": bom_pn, "QtyNeed": total_qty_needed,
+            "Status": "Not Found", "Sources": 0, "StockAvail": 0,
+            "COO": "Unknown", "RiskScore": 10.0, "TariffRate": np.nan,
+            "BestCostPerRaw": np.nan, "BestTotalCostRaw": np.nan, "ActualBuyQty": np.nan,
+            "BestCostLT": np.nan, "BestCostSrc": "N/A",
+            "Description": "No supplier data — check API keys",
+            "Notes": "No data", "_options": [], "_valid": False,
+        }
+
+    all_options = build_options(supplier_data, bom_pn, bom_mfg, total_qty_needed, buy_up_pct)
+    valid_options, best_cost_option, fastest_option = pick_best(all_options, total_qty_needed)
+    return format_row(bom_pn, bom_mfg, total_qty_needed, all_options, valid_options,
+                      best_cost_option, fastest_option, custom_tariffs)
+
+
+def score_bom_risk(results):
+    """
+    Fill RiskScore and the flat RiskSourcing/RiskStock/RiskLeadTime/RiskLifecycle/
+    RiskGeographic sub-scores for every part with supplier data in one vectorized pass.
+    """
+    scored = [r for r in results if "_risk_inputs" in r]
+    if not scored: return results
+    overall, risk_factors = calculate_risk_scores(pd.DataFrame([r["_risk_inputs"] for r in scored]))
+    for r, score, rf in zip(scored, overall, risk_factors.add_prefix("Risk").to_dict("records")):
+        r["RiskScore"] = float(score)
+        r.update(rf)
+    return results
+
+
+def analyze_bom(rows, config, mouser_key, nexar_id, nexar_secret, on_progress=None, refresh=False):
+    """
+    Analyze a whole BOM. rows is a list of (part_number, manufacturer, qty_per_unit).
+    The shared supplier pool serves every (batch, supplier) lookup so requests for
+    different parts overlap; a part number repeated across BOM lines is fetched
+    once and its supplier data shared by every line (each line is still priced
+    for its own quantity). on_progress(done, total, pn) is called from the
+    calling thread as each unique part's lookups finish. refresh=True re-queries the
+    suppliers for this run without touching the shared caches. Returns results in BOM order.
+    """
+    analyze_part  = partial(analyze_single_part,
+        total_units    = config.get("total_units", 100),
+        buy_up_pct     = config.get("buy_up_threshold", 1.0),
+        custom_tariffs = {c.lower(): r for c, r in config.get("custom_tariff_rates", {}).items()})
+    supplier_data = {pn: {} for pn, _, _ in rows}
+    pending       = dict.fromkeys(supplier_data, 0)
+    tasks         = {}
+
+    if nexar_id and nexar_secret:
+        # Fetch the OAuth token once up front instead of letting the first wave of
+        # workers queue on it; if it can't be had, every Nexar lookup would fail anyway.
+        try:    _nexar_token(nexar_id, nexar_secret)
+        except: nexar_id = nexar_secret = None
+
+    submit = partial(_supplier_pool().submit, _with_script_ctx, get_script_run_ctx())
+    unique = list(supplier_data)
+    lookups = []
+    if mouser_key:
+        lookups.append(("Mouser", MOUSER_BATCH_SIZE, partial(search_mouser, api_key=mouser_key, refresh=refresh)))
+    if nexar_id and nexar_secret:
+        lookups.append(("Nexar", NEXAR_BATCH_SIZE,
+                        partial(search_nexar, client_id=nexar_id, client_secret=nexar_secret,
+                                refresh=refresh)))
+    for name, size, search in lookups:
+        for b in range(0, len(unique), size):
+            batch = tuple(unique[b:b + size])
+            tasks[submit(search, batch)] = (batch, name)
+    for pns, _ in tasks.values():
+        for pn in pns: pending[pn] += 1
+
+    done = 0
+    for future in as_completed(tasks):
+        pns, name = tasks[future]
+        try:    found = future.result()
+        except: found = {}
+        for pn in pns:
+            if isinstance(found.get(pn), dict):
+                supplier_data[pn][name] = found[pn]
+            pending[pn] -= 1
+            if pending[pn] == 0:
+                done += 1
+                if on_progress: on_progress(done, len(supplier_data), pn)
+
+    results = [analyze_part(pn, mfg, qty, supplier_data[pn]) for pn, mfg, qty in rows]
+    return score_bom_risk(results)
+
+
 def calculate_strategies(part_results, config):
     """
     Port of calculate_summary_metrics strategy engine.
+    Every valid option of every part is flattened into one options frame; the
+    shared columns (cost, in-stock, effective LT) are computed once and each
+    strategy is picked per part with a stable lexsort over them.
     Returns dict of strategy summaries.
     """
-    total_units   = config.get("total_units", 100)
     target_lt     = config.get("target_lead_time_days", 56)
     max_premium   = config.get("max_premium", 15.0)
     cost_weight   = config.get("cost_weight", 0.5)
     lead_weight   = config.get("lead_time_weight", 0.5)
-    buy_up_pct    = config.get("buy_up_threshold", 1.0)
 
     strategies = {
         "Lowest Cost (Strict)":      {"total_cost": 0.0, "max_lt": 0, "parts": {}, "invalid": False},
@@ -622,109 +1033,441 @@ def calculate_strategies(part_results, config):
         "Optimized (Cost+LT)":       {"total_cost": 0.0, "max_lt": 0, "parts": {}, "invalid": False},
     }
 
+    # ── Flatten options (one row per priced option, keyed by BOM row) ──────
+    pns, opt_refs, records = [], [], []
     for part in part_results:
         if not part.get("_valid"): continue
-        opts        = part["_options"]
-        pn          = part["PartNumber"]
-        qty_needed  = part["QtyNeed"]
-        valid_opts  = [o for o in opts if pd.notna(o.get("cost")) and o.get("cost", np.inf) != np.inf]
+        valid_opts = [o for o in part["_options"] if isfinite(o["cost"])]
         if not valid_opts: continue
-
-        # ── Lowest Cost Strict ─────────────────────────────────────────────
-        best = min(valid_opts, key=lambda o: o.get("cost", np.inf))
-        strategies["Lowest Cost (Strict)"]["parts"][pn]  = best
-        strategies["Lowest Cost (Strict)"]["total_cost"] += best.get("cost", 0)
-        lt = best.get("lead_time", 0)
-        if not (isinstance(lt, float) and np.isinf(lt)):
-            strategies["Lowest Cost (Strict)"]["max_lt"] = max(strategies["Lowest Cost (Strict)"]["max_lt"], int(lt or 0))
-
-        # ── Lowest Cost In-Stock ───────────────────────────────────────────
-        in_stock = [o for o in valid_opts if o.get("stock",0) >= qty_needed]
-        chosen   = min(in_stock, key=lambda o: o.get("cost", np.inf)) if in_stock else best
-        strategies["Lowest Cost (In Stock)"]["parts"][pn]  = chosen
-        strategies["Lowest Cost (In Stock)"]["total_cost"] += chosen.get("cost", 0)
-
-        # ── Fastest Lead Time ──────────────────────────────────────────────
-        def eff_lt(o): return 0 if o.get("stock",0) >= qty_needed else o.get("lead_time", np.inf)
-        fastest = min(valid_opts, key=lambda o: (eff_lt(o), o.get("cost", np.inf)))
-        strategies["Fastest Lead Time"]["parts"][pn]  = fastest
-        strategies["Fastest Lead Time"]["total_cost"] += fastest.get("cost", 0)
-        flt = eff_lt(fastest)
-        if not (isinstance(flt, float) and np.isinf(flt)):
-            strategies["Fastest Lead Time"]["max_lt"] = max(strategies["Fastest Lead Time"]["max_lt"], int(flt or 0))
-
-        # ── Optimized (Cost + Lead Time) ───────────────────────────────────
-        baseline_cost = best.get("cost", np.inf)
-        constrained   = []
+        row = len(pns)
+        pns.append(part["PartNumber"])
         for o in valid_opts:
-            cost_o    = o.get("cost", np.inf)
-            eff_lt_o  = eff_lt(o)
-            if eff_lt_o == np.inf or eff_lt_o > target_lt: continue
-            if baseline_cost > 1e-9:
-                prem = (cost_o - baseline_cost) / baseline_cost * 100
-            else:
-                prem = 0
-            if prem > max_premium: continue
-            constrained.append(o)
-
-        if constrained:
-            costs = [safe_float(o.get("cost")) for o in constrained]
-            lts   = [eff_lt(o) for o in constrained if eff_lt(o) != np.inf]
-            min_c = min(costs) if costs else 0; max_c = max(costs) if costs else 1
-            min_l = min(lts)   if lts   else 0; max_l = max(lts)   if lts   else 1
-            c_rng = max(max_c - min_c, 1e-9); l_rng = max(max_l - min_l, 1e-9)
-            best_score = np.inf; opt_chosen = None
-            for o in constrained:
-                nc    = (safe_float(o.get("cost")) - min_c) / c_rng
-                nl    = (eff_lt(o) - min_l) / l_rng if eff_lt(o) != np.inf else 1.0
-                score = cost_weight * nc + lead_weight * nl
-                if o.get("eol") or o.get("discontinued"): score += 0.5
-                if o.get("stock",0) < qty_needed: score += 0.1
-                if score < best_score:
-                    best_score = score; opt_chosen = o
-        else:
-            opt_chosen = fastest  # fallback
-
-        strategies["Optimized (Cost+LT)"]["parts"][pn]  = opt_chosen or best
-        strategies["Optimized (Cost+LT)"]["total_cost"] += (opt_chosen or best).get("cost", 0)
-        olt = eff_lt(opt_chosen or best)
-        if not (isinstance(olt, float) and np.isinf(olt)):
-            strategies["Optimized (Cost+LT)"]["max_lt"] = max(strategies["Optimized (Cost+LT)"]["max_lt"], int(olt or 0))
+            opt_refs.append(o)
+            records.append((row, o.get("cost", np.inf), o.get("lead_time", np.inf), o.get("stock", 0),
+                            part["QtyNeed"], bool(o.get("eol") or o.get("discontinued"))))
+    if not records:
+        return strategies
+
+    # Lead days are narrowed (whole numbers, exact in float32). Stock/qty stay int64 —
+    # qty is per-unit qty × total_units and must never wrap — and costs stay float64
+    # so totals and tie-breaks match the scalar per-part math bit-for-bit.
+    opts = pd.DataFrame.from_records(records, columns=["row","cost","lead_time","stock","qty_needed","eol_disc"])\
+             .astype({"lead_time": np.float32, "stock": np.int64, "qty_needed": np.int64})
+    rows     = opts["row"].to_numpy()
+    costs    = opts["cost"].to_numpy()
+    in_stock = (opts["stock"] >= opts["qty_needed"]).to_numpy()
+    eff_lt   = np.where(in_stock, 0, opts["lead_time"].to_numpy())
+
+    def first_per_row(keys, row_ids=rows):
+        """Position of each row's winner: lexsort is stable, so ties go to the first option."""
+        order = np.lexsort((*keys, row_ids))
+        r     = row_ids[order]
+        return order[np.r_[True, r[1:] != r[:-1]]]
+
+    # ── Strict / In-Stock / Fastest: one ranked pass each over shared columns ─
+    strict  = first_per_row((costs,))
+    instock = first_per_row((costs, ~in_stock))          # in-stock first, else falls back to strict
+    fastest = first_per_row((costs, eff_lt))             # min effective LT, then cost
+
+    # ── Optimized (Cost + Lead Time) ───────────────────────────────────────
+    baseline = costs[strict][rows]
+    premium  = np.divide(costs - baseline, baseline, out=np.zeros_like(costs), where=baseline > 1e-9) * 100
+    mask     = (eff_lt != np.inf) & (eff_lt <= target_lt) & (premium <= max_premium)
+    optimized = fastest.copy()
+    if mask.any():
+        c_rows = rows[mask]; c_cost = costs[mask]
+        c_lt   = eff_lt[mask].astype(np.float64)        # normalize in float64, like the scalar engine
+        bounds = pd.DataFrame({"cost": c_cost, "lt": c_lt}).groupby(c_rows).agg(["min","max"])
+        pos    = np.searchsorted(bounds.index.to_numpy(), c_rows)
+        min_c, max_c, min_l, max_l = (bounds[col].to_numpy()[pos] for col in
+                                      (("cost","min"), ("cost","max"), ("lt","min"), ("lt","max")))
+        c_rng  = np.maximum(max_c - min_c, 1e-9); l_rng = np.maximum(max_l - min_l, 1e-9)
+        score  = cost_weight * ((c_cost - min_c) / c_rng) + lead_weight * ((c_lt - min_l) / l_rng)
+        score  = np.where(opts["eol_disc"].to_numpy()[mask], score + 0.5, score)
+        score  = np.where(in_stock[mask], score, score + 0.1)
+        winners = np.flatnonzero(mask)[first_per_row((score,), c_rows)]
+        optimized[bounds.index.to_numpy()] = winners
+
+    # ── Assemble strategy dicts in BOM order ───────────────────────────────
+    lead_time = opts["lead_time"].to_numpy()
+    for name, idx, lts in (("Lowest Cost (Strict)",   strict,    lead_time),
+                           ("Lowest Cost (In Stock)", instock,   None),
+                           ("Fastest Lead Time",      fastest,   eff_lt),
+                           ("Optimized (Cost+LT)",    optimized, eff_lt)):
+        strat = strategies[name]
+        for row, i in enumerate(idx):
+            strat["parts"][pns[row]] = opt_refs[i]
+        strat["total_cost"] = sum(costs[idx].tolist(), strat["total_cost"])
+        if lts is not None:
+            lts = lts[idx]
+            strat["max_lt"] = max([strat["max_lt"], *(int(lt or 0) for lt in lts[~np.isinf(lts)].tolist())])
 
     return strategies
 
 
-def groq_ai_summary(data_context, groq_key, model):
-    """Call Groq API to generate executive AI summary."""
-    if not groq_key:
-        return "⚠️ Add your free Groq API key in the sidebar to enable AI summaries."
+class _GroqAPIError(Exception):
+    """Groq answered without choices — surfaced to the user, never cached."""
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _groq_summary_cached(data_context, key_digest, model, _groq_key):
+    """One Groq completion per (context, key digest, model) per day. Raises on failure."""
     system_prompt = ("You are a strategic supply chain advisor specializing in electronic components. "
                      "Provide concise, actionable insights for executive review. "
                      "Focus on risk, cost optimization, and build readiness.")
+    r = _post_json(
+        "https://api.groq.com/openai/v1/chat/completions",
+        {"model": model,
+         "messages":[{"role":"system","content":system_prompt},
+                      {"role":"user","content":data_context}],
+         "max_tokens": 1200, "temperature": 0.6},
+        headers={"Authorization": f"Bearer {_groq_key}"},
+        timeout=30)
+    result = orjson.loads(r.content)
+    if "choices" in result:
+        return result["choices"][0]["message"]["content"].strip()
+    raise _GroqAPIError(result.get('error',{}).get('message','Unknown'))
+
+
+def groq_ai_summary(data_context, groq_key, model):
+    """Call Groq API to generate executive AI summary. Identical requests are served from cache."""
+    if not groq_key:
+        return "⚠️ Add your free Groq API key in the sidebar to enable AI summaries."
     try:
-        r = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={"Authorization": f"Bearer {groq_key}", "Content-Type":"application/json"},
-            json={"model": model,
-                  "messages":[{"role":"system","content":system_prompt},
-                               {"role":"user","content":data_context}],
-                  "max_tokens": 1200, "temperature": 0.6},
-            timeout=30)
-        result = r.json()
-        if "choices" in result:
-            return result["choices"][0]["message"]["content"].strip()
-        return f"Groq error: {result.get('error',{}).get('message','Unknown')}"
+        return _groq_summary_cached(data_context, _key_digest(groq_key), model, groq_key)
+    except _GroqAPIError as e:
+        return f"Groq error: {e}"
     except Exception as e:
         return f"Error calling Groq: {e}"
 
 
 # ── Streamlit Color Helpers ────────────────────────────────────────────────────
 
-def color_risk_cell(val):
-    if not isinstance(val, (int, float)): return ""
-    if val >= 6.6:   return "background-color:#fee2e2; color:#900"
-    elif val >= 3.6: return "background-color:#fef3c7; color:#7d3f00"
-    return "background-color:#dcfce7; color:#155724"
+def fmt_pct(rate):
+    """Tariff rate (0.125) → display string ("12.5%"); N/A when missing."""
+    return f"{rate*100:.1f}%" if rate == rate else "N/A"
+
+
+def fmt_int(value):
+    """Whole-number display string (lead days, buy qty); N/A when missing."""
+    return f"{value:.0f}" if value == value else "N/A"
+
+
+def color_risk_col(col):
+    """Styler.apply helper: CSS for a whole risk-score column in one vectorized pass."""
+    return np.select([col >= RISK_HIGH_MIN, col >= RISK_MOD_MIN],
+                     ["background-color:#fee2e2; color:#900", "background-color:#fef3c7; color:#7d3f00"],
+                     default="background-color:#dcfce7; color:#155724")
+
+
+# ── Results Frame Builders ────────────────────────────────────────────────────
+# Derived display/export frames depend only on the analysis results (and total
+# units), so they are memoized in session_state — keyed on the per-run
+# results_token — rather than rebuilt on every widget-triggered rerun.
+
+def session_memo(name, key, build):
+    """Return st.session_state[name] built by build(), rebuilding only when key changes."""
+    slot = st.session_state.get(name)
+    if slot is None or slot[0] != key:
+        slot = (key, build())
+        st.session_state[name] = slot
+    return slot[1]
+
+
+def summarize_results(results):
+    """KPI counters and the part lists the diagnostic/AI sections need, in one pass."""
+    s = dict(total_cost_best=0.0, total_cost_tariff=0.0, high_risk=0, mod_risk=0, low_risk=0,
+             eol_count=0, no_stock=0, valid=[], not_found=[], high_risk_parts=[], eol_parts=[],
+             stock_gap_parts=[])
+    for r in results:
+        rs = r.get("RiskScore", 0)
+        if rs >= RISK_HIGH_MIN:
+            s["high_risk"] += 1
+            s["high_risk_parts"].append(r)
+        elif rs >= RISK_MOD_MIN: s["mod_risk"] += 1
+        else:                    s["low_risk"] += 1
+        if r.get("Status") in ("EOL", "Discontinued"):
+            s["eol_count"] += 1
+            s["eol_parts"].append(r)
+        stock = r.get("StockAvail", 0)
+        if stock == 0: s["no_stock"] += 1
+        if stock < r.get("QtyNeed", 0): s["stock_gap_parts"].append(r)
+        if r.get("_valid"):
+            s["valid"].append(r)
+            s["total_cost_best"]   += r.get("BestTotalCostRaw", 0) or 0
+            s["total_cost_tariff"] += r.get("BestTotalWithTariff", 0) or 0
+        else:
+            s["not_found"].append(r)
+    return s
+
+
+def _categorize(df, cols=("Manufacturer", "Best Supplier", "COO", "Status")):
+    """Low-cardinality text columns as category dtype (small int codes, not a str per cell)."""
+    return df.astype({c: "category" for c in cols if c in df})
+
+
+def _downcast_counts(df, cols=("BOM Qty", "Total Qty", "Sources", "Stock")):
+    """Whole-number count columns in the smallest int dtype that holds them."""
+    return df.assign(**{c: pd.to_numeric(df[c], downcast="integer") for c in cols if c in df})
+
+
+def build_display_df(results, total_units):
+    """Tab 1 results table (raw numbers; formatting is done by the Styler)."""
+    return _downcast_counts(_categorize(pd.DataFrame({
+        "Part Number":    [r["PartNumber"] for r in results],
+        "Description":    pd.Series([r.get("Description","") for r in results], dtype=object).str.slice(0, 60),
+        "BOM Qty":        [r["QtyNeed"] // total_units for r in results],
+        "Total Qty":      [r["QtyNeed"] for r in results],
+        "Sources":        [r["Sources"] for r in results],
+        "Best Supplier":  [r["BestCostSrc"] for r in results],
+        "Unit Cost ($)":  [r.get("BestCostPerRaw", np.nan) for r in results],
+        "Total Cost ($)": [r.get("BestTotalCostRaw", np.nan) for r in results],
+        "w/Tariff ($)":   [r.get("BestTotalWithTariff", np.nan) for r in results],
+        "Tariff":         [r["TariffRate"] for r in results],
+        "Stock":          [r["StockAvail"] for r in results],
+        "Lead (days)":    [r["BestCostLT"] for r in results],
+        "COO":            [r["COO"] for r in results],
+        "Status":         [r["Status"] for r in results],
+        "Risk Score":     [r["RiskScore"] for r in results],
+        "Notes":          [r.get("Notes","") for r in results],
+    })))
+
+
+def build_risk_factor_df(results):
+    """Per-part risk factor breakdown, highest overall risk first."""
+    ranked = sorted(results, key=lambda x: x.get("RiskScore",0), reverse=True)
+    return _categorize(pd.DataFrame({
+        "Part Number": [r["PartNumber"] for r in ranked],
+        "Overall Risk": [r["RiskScore"] for r in ranked],
+        "Sourcing":    [r.get("RiskSourcing","") for r in ranked],
+        "Stock":       [r.get("RiskStock","") for r in ranked],
+        "Lead Time":   [r.get("RiskLeadTime","") for r in ranked],
+        "Lifecycle":   [r.get("RiskLifecycle","") for r in ranked],
+        "Geographic":  [r.get("RiskGeographic","") for r in ranked],
+        "Status":      [r["Status"] for r in ranked],
+        "COO":         [r["COO"] for r in ranked],
+    }))
+
+
+def build_export_df(results, total_units):
+    """Full BOM analysis CSV export."""
+    return _categorize(pd.DataFrame({
+        "Part Number":    [r["PartNumber"] for r in results],
+        "Manufacturer":   [r["Manufacturer"] for r in results],
+        "MfgPN":          [r["MfgPN"] for r in results],
+        "Description":    [r.get("Description","") for r in results],
+        "BOM Qty":        [r["QtyNeed"] // total_units for r in results],
+        "Total Qty Needed": [r["QtyNeed"] for r in results],
+        "Best Supplier":  [r["BestCostSrc"] for r in results],
+        "Unit Cost ($)":  [r.get("BestCostPerRaw","") for r in results],
+        "Total Cost ($)": [r.get("BestTotalCostRaw","") for r in results],
+        "Total w/Tariff ($)": [r.get("BestTotalWithTariff","") for r in results],
+        "Tariff Rate":    [fmt_pct(r["TariffRate"]) for r in results],
+        "Actual Buy Qty": [fmt_int(r["ActualBuyQty"]) for r in results],
+        "Stock Available": [r["StockAvail"] for r in results],
+        "Lead Time (days)": [fmt_int(r["BestCostLT"]) for r in results],
+        "COO":            [r["COO"] for r in results],
+        "Status":         [r["Status"] for r in results],
+        "Risk Score":     [r["RiskScore"] for r in results],
+        "Sourcing Risk":  [r.get("RiskSourcing","") for r in results],
+        "Stock Risk":     [r.get("RiskStock","") for r in results],
+        "LeadTime Risk":  [r.get("RiskLeadTime","") for r in results],
+        "Lifecycle Risk": [r.get("RiskLifecycle","") for r in results],
+        "Geographic Risk": [r.get("RiskGeographic","") for r in results],
+        "Datasheet":      [r.get("DatasheetUrl","") for r in results],
+        "Notes":          [r.get("Notes","") for r in results],
+    }))
+
+
+def build_strategy_df(strat_parts):
+    """Tab 2 per-part detail for one purchasing strategy."""
+    strat_rows = []
+    for pn, opt in strat_parts.items():
+        lt_val = opt.get("lead_time", np.inf)
+        lt_str = f"{lt_val:.0f}" if isfinite(lt_val) else "In Stock / N/A"
+        strat_rows.append({
+            "Part Number":   pn,
+            "Supplier":      opt.get("source","N/A"),
+            "Unit Cost ($)": opt.get("unit_cost", np.nan),
+            "Total Cost ($)": opt.get("cost", np.nan),
+            "Qty Order":     opt.get("actual_order_qty","N/A"),
+            "Stock":         opt.get("stock",0),
+            "Lead (days)":   lt_str,
+            "Notes":         opt.get("notes",""),
+        })
+    return pd.DataFrame(strat_rows)
+
+
+def to_csv_bytes(df):
+    """Download payload; callers memoize it so reruns don't re-serialize the frame."""
+    return df.to_csv(index=False).encode("utf-8")
+
+
+# ── Charts ────────────────────────────────────────────────────────────────────
+# Plain bar charts are Vega-Lite specs drawn in the browser (no server-side PNG);
+# the category order is pinned with an explicit sort and values are labelled by a
+# text layer. Charts that need a colormap or reference lines stay on matplotlib,
+# built with matplotlib.figure.Figure (not pyplot) so cached figures are never
+# registered with — or leaked by — pyplot.
+
+def _vega_bars(df, cat, val, title, *, horizontal=False, color="#0078d4", label=None):
+    """Layered Vega-Lite bar spec: categories in df order (top-down for horizontal),
+    colour either a constant or a df column, and an optional per-bar text label column."""
+    order   = list(dict.fromkeys(df[cat]))
+    cat_enc = {"field": cat, "type": "nominal", "sort": order[::-1] if horizontal else order,
+               "axis": {"labelAngle": 0}}
+    val_enc = {"field": val, "type": "quantitative", "stack": None}
+    colour  = ({"field": color, "type": "nominal", "scale": None, "legend": None}
+               if color in df else {"value": color})
+    layers  = [{"mark": "bar", "encoding": {"color": colour}}]
+    if label:
+        layers.append({"mark": {"type": "text", "baseline": "bottom", "dy": -4, "fontWeight": "bold"},
+                       "encoding": {"text": {"field": label, "type": "nominal"}}})
+    return {"title": title, "height": 400, "background": "#f8f9fa",
+            "encoding": {"y": cat_enc, "x": val_enc} if horizontal else {"x": cat_enc, "y": val_enc},
+            "layer": layers}
+
+
+def _vega_risk_distribution(results, valid_results, strategies):
+    risk   = np.array([r.get("RiskScore",0) for r in results], dtype=float)
+    counts = [int((risk <= 3.5).sum()), int(((risk > 3.5) & (risk <= 6.5)).sum()), int((risk > 6.5).sum())]
+    df = pd.DataFrame({
+        "Risk Band":       ["🟢 Low (0–3.5)", "🟡 Moderate (3.6–6.5)", "🔴 High (6.6–10)"],
+        "Number of Parts": counts,
+        "Color":           ["#107c10","#ca5010","#d13438"],
+        "Label":           [str(c) for c in counts],
+    })
+    return df, _vega_bars(df, "Risk Band", "Number of Parts", "Risk Score Distribution",
+                          color="Color", label="Label")
+
+
+def _vega_top_cost(results, valid_results, strategies):
+    top = sorted(valid_results, key=lambda r: r.get("BestTotalCostRaw",0) or 0, reverse=True)[:20]
+    df  = pd.DataFrame({
+        "Part Number":        [r["PartNumber"] for r in top],
+        "Extended Cost ($)":  [r.get("BestTotalCostRaw",0) or 0 for r in top],
+    })
+    return df, _vega_bars(df, "Part Number", "Extended Cost ($)", "Top 20 Parts by Cost", horizontal=True)
+
+
+def _vega_strategy_costs(results, valid_results, strategies):
+    names  = list(strategies.keys())
+    totals = [strategies[n]["total_cost"] for n in names]
+    df = pd.DataFrame({
+        "Strategy":            names,
+        "Total BOM Cost ($)":  totals,
+        "Color":               ["#0078d4","#107c10","#ca5010","#d13438"][:len(names)],
+        "Label":               [f"${v:,.0f}" for v in totals],
+    })
+    return df, _vega_bars(df, "Strategy", "Total BOM Cost ($)", "Purchasing Strategy Cost Comparison",
+                          color="Color", label="Label")
+
+
+VEGA_CHARTS = {
+    "Risk Score Distribution":        _vega_risk_distribution,
+    "Top Parts by Cost":              _vega_top_cost,
+    "Strategy Cost Comparison":       _vega_strategy_costs,
+}
+
+
+def _chart_stock_vs_need(fig, ax, results, valid_results, strategies):
+    scores  = [r.get("RiskScore",0) for r in results]
+    x_vals  = [r.get("QtyNeed",0) for r in results]
+    y_vals  = [r.get("StockAvail",0) for r in results]
+    sc = ax.scatter(x_vals, y_vals, c=scores, cmap="RdYlGn_r",
+                   s=80, alpha=0.75, vmin=0, vmax=10)
+    mx = max(max(x_vals,default=1), max(y_vals,default=1))*1.1
+    ax.plot([0,mx],[0,mx],"k--",alpha=0.4,label="Stock = Needed")
+    fig.colorbar(sc, ax=ax, label="Risk Score")
+    ax.set_xlabel("Qty Needed"); ax.set_ylabel("Stock Available")
+    ax.set_title("Stock vs Quantity Needed")
+    ax.legend()
+
+
+def _chart_tariff_impact(fig, ax, results, valid_results, strategies):
+    top = sorted(valid_results, key=lambda r: r.get("BestTotalCostRaw",0) or 0, reverse=True)[:15]
+    pns  = [r["PartNumber"] for r in top]
+    base = [r.get("BestTotalCostRaw",0) or 0 for r in top]
+    tariff_add = [(r.get("BestTotalWithTariff",0) or 0) - (r.get("BestTotalCostRaw",0) or 0) for r in top]
+    x = range(len(pns))
+    ax.bar(x, base, label="Base Cost", color="#0078d4")
+    ax.bar(x, tariff_add, bottom=base, label="Tariff Add-on", color="#d13438", alpha=0.8)
+    ax.set_xticks(list(x)); ax.set_xticklabels(pns, rotation=45, ha="right", fontsize=8)
+    ax.set_ylabel("Cost ($)"); ax.set_title("Base Cost vs Tariff Impact")
+    ax.legend()
+
+
+def _chart_coo_risk(fig, ax, results, valid_results, strategies):
+    geo_df   = pd.DataFrame(results, columns=["COO","RiskGeographic"]).fillna({"COO": "Unknown", "RiskGeographic": _GEO_DEFAULT})
+    coo_risk = geo_df.groupby("COO", sort=False)["RiskGeographic"].max()
+    coos  = coo_risk.index.tolist()
+    risks = coo_risk.tolist()
+    colors= ["#d13438" if v>=7 else "#ca5010" if v>=4 else "#107c10" for v in risks]
+    ax.barh(coos, risks, color=colors)
+    ax.set_xlabel("Geographic Risk Score (0-10)")
+    ax.set_title("Geographic Risk by Country of Origin")
+    ax.axvline(x=5, color="orange", linestyle="--", alpha=0.6, label="Moderate threshold")
+    ax.axvline(x=7, color="red",    linestyle="--", alpha=0.6, label="High threshold")
+    ax.legend(fontsize=8)
+
+
+CHART_BUILDERS = {
+    "Stock vs Qty Needed":            _chart_stock_vs_need,
+    "Cost + Tariff Impact (Top 15)":  _chart_tariff_impact,
+    "COO Geographic Risk Map":        _chart_coo_risk,
+}
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def render_chart(chart_type, results_token, _results, _strategies):
+    """Build one Tab 3 chart. Cached per (chart, analysis run) so reruns and tab switches reuse it."""
+    fig = Figure(figsize=(11,5))
+    ax  = fig.subplots()
+    fig.patch.set_facecolor("#f8f9fa"); ax.set_facecolor("#f8f9fa")
+    CHART_BUILDERS[chart_type](fig, ax, _results, [r for r in _results if r.get("_valid")], _strategies)
+    fig.tight_layout()
+    return fig
+
+
+# ── BOM Loading ───────────────────────────────────────────────────────────────
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_bom(data):
+    """
+    Parse and clean an uploaded BOM CSV (raw bytes). Memoized on the file content,
+    so widget reruns reuse the parsed frame instead of re-reading the upload.
+    Returns (bom_df, cleaned_log), or (None, []) when required columns are missing.
+    """
+    # Header-only probe first, so the real read parses just the columns we use
+    # (wide ERP exports carry dozens of metadata columns) with no type inference
+    header  = pd.read_csv(io.BytesIO(data), nrows=0, skipinitialspace=True).columns
+    col_map = {c: _COLUMN_ALIASES[k] for c in header
+               if (k := _HEADER_JUNK_RE.sub("", c.strip().lower())) in _COLUMN_ALIASES}
+    raw_df  = pd.read_csv(io.BytesIO(data), skipinitialspace=True, on_bad_lines='skip', engine="c",
+                          usecols=list(col_map), dtype=str)
+    # Collapse any embedded newlines inside fields (common Excel CSV export artifact)
+    raw_df = raw_df.apply(lambda col: col.str.replace("\n", " ", regex=False)
+                                         .str.replace("\r", "", regex=False).str.strip())
+
+    # Normalize columns (same logic as source startup guide)
+    raw_df.rename(columns=col_map, inplace=True)
+    if "Part Number" not in raw_df.columns or "Quantity" not in raw_df.columns:
+        return None, []
+
+    raw_df["Quantity"]     = safe_float_series(raw_df["Quantity"], default=1).astype(int)
+    raw_df["Part Number"]  = raw_df["Part Number"].astype(str)
+    raw_df["Manufacturer"] = raw_df.get("Manufacturer", pd.Series([""] * len(raw_df))).fillna("").astype(str)
+    raw_df = raw_df[raw_df["Part Number"].str.len() > 0].dropna(subset=["Part Number"])
+
+    # Auto-clean part numbers, logging every change for review
+    cleaned_log = []
+    def apply_clean(pn):
+        cleaned, original, changes = clean_part_number(pn)
+        if changes:
+            cleaned_log.append({"Original": original, "Cleaned To": cleaned, "Changes": ", ".join(changes)})
+        return cleaned
+    raw_df["Part Number"] = raw_df["Part Number"].apply(apply_clean)
+    return raw_df, cleaned_log
 
 
 # ── Sidebar ───────────────────────────────────────────────────────────────────
@@ -757,6 +1500,12 @@ with st.sidebar:
     col_s2.markdown("🟢 Nexar"  if (nexar_id and nexar_secret) else "⚫ Nexar")
     col_s3.markdown("🟢 Groq"   if groq_key     else "⚫ Groq")
     st.caption("Keys are session-only and never stored.")
+    if st.button("🧹 Clear Supplier Cache", use_container_width=True,
+                 help="Supplier lookups are cached (1h in memory, 6h on disk). Clear to force fresh pricing & stock."):
+        if clear_supplier_cache(): st.toast("Supplier cache cleared")
+        else: st.toast("⚠️ Memory cache cleared, but the disk cache could not be written")
+    force_refresh = st.toggle("🔄 Force refresh on every run", value=False,
+                              help="Ignore cached supplier data and re-query Mouser/Nexar each time the analysis runs.")
 
     st.divider()
     st.markdown("**🏗️ Build Configuration**")
@@ -782,7 +1531,7 @@ with st.sidebar:
             rate_str = st.text_input(country, value="", key=f"tariff_{country}", label_visibility="visible")
             if rate_str.strip():
                 r = safe_float(rate_str)
-                if pd.notna(r) and r >= 0:
+                if _notna(r) and r >= 0:
                     custom_tariffs[country] = r / 100.0
 
 config = {
@@ -818,38 +1567,12 @@ with col_tmpl:
 
 if uploaded:
     try:
-        raw_df = pd.read_csv(uploaded, skipinitialspace=True, on_bad_lines='skip')
-        # Collapse any embedded newlines inside fields (common Excel CSV export artifact)
-        raw_df = raw_df.apply(lambda col: col.map(lambda v: str(v).replace("\n"," ").replace("\r","").strip() if isinstance(v, str) else v))
-        raw_df.columns = [c.strip() for c in raw_df.columns]
-
-        # Normalize columns (same logic as source startup guide)
-        col_map = {}
-        for c in raw_df.columns:
-            cl = c.lower().replace(" ","").replace("_","").replace(".","")
-            if cl in ["partnumber","pn","mpn","partno","partnum"]:   col_map[c]="Part Number"
-            elif cl in ["quantity","qty","q","amount","qtyperunit"]: col_map[c]="Quantity"
-            elif cl in ["manufacturer","mfg","mfr"]:                 col_map[c]="Manufacturer"
-            elif cl in ["description","desc","partdescription"]:     col_map[c]="Description"
-        raw_df.rename(columns=col_map, inplace=True)
-
-        if "Part Number" not in raw_df.columns or "Quantity" not in raw_df.columns:
+        raw_df, cleaned_log = load_bom(uploaded.getvalue())
+        if raw_df is None:
             st.error("❌ CSV must have 'Part Number' and 'Quantity' columns.")
             st.stop()
 
-        raw_df["Quantity"]     = pd.to_numeric(raw_df["Quantity"], errors="coerce").fillna(1).astype(int)
-        raw_df["Part Number"]  = raw_df["Part Number"].astype(str).str.strip()
-        raw_df["Manufacturer"] = raw_df.get("Manufacturer", pd.Series([""] * len(raw_df))).fillna("").astype(str)
-        raw_df = raw_df[raw_df["Part Number"].str.len() > 0].dropna(subset=["Part Number"])
-
-        # ── Auto-clean part numbers & report changes ───────────────────────
-        cleaned_log = []
-        def apply_clean(pn):
-            cleaned, original, changes = clean_part_number(pn)
-            if changes:
-                cleaned_log.append({"Original": original, "Cleaned To": cleaned, "Changes": ", ".join(changes)})
-            return cleaned
-        raw_df["Part Number"] = raw_df["Part Number"].apply(apply_clean)
+        # ── Report auto-cleaned part numbers ───────────────────────────────
         if cleaned_log:
             with st.expander(f"🔧 Auto-cleaned {len(cleaned_log)} part number(s) — click to review", expanded=True):
                 st.caption("These part numbers had formatting issues (apostrophes, suffixes) that were automatically fixed before sending to supplier APIs.")
@@ -871,48 +1594,51 @@ if uploaded:
         if run_btn:
             st.session_state.pop("results", None)
             st.session_state.pop("strategies", None)
+            st.session_state.pop("summary", None)
             st.session_state.pop("ai_summary", None)
-
-            nexar_token_cache = {}
-            results = []
             progress_bar = st.progress(0, text="Starting analysis...")
             status_txt   = st.empty()
-            total_parts  = len(raw_df)
-
-            for i, row in raw_df.iterrows():
-                pn   = str(row["Part Number"]).strip()
-                qty  = int(row["Quantity"])
-                mfg  = str(row.get("Manufacturer","")).strip()
-                status_txt.text(f"🔍 {pn}  ({len(results)+1}/{total_parts})")
-                progress_bar.progress((len(results)+1)/total_parts, text=f"Analyzing {pn}…")
 
-                result = analyze_single_part(pn, mfg, qty, config,
-                                             mouser_key, nexar_id, nexar_secret, nexar_token_cache)
-                results.append(result)
-                time.sleep(0.1)  # polite rate-limiting
+            last_update = [0.0]
+            def show_progress(done, total, pn):
+                # Each update is a websocket message — cap at ~20/s, always show the last one
+                now = time.perf_counter()
+                if done < total and now - last_update[0] < 0.05: return
+                last_update[0] = now
+                status_txt.text(f"🔍 {pn}  ({done}/{total})")
+                progress_bar.progress(done/total, text=f"Analyzing {pn}…")
+
+            mfgs     = raw_df["Manufacturer"].tolist() if "Manufacturer" in raw_df else [""] * len(raw_df)
+            bom_rows = [(str(pn).strip(), str(mfg).strip(), int(qty))
+                        for pn, mfg, qty in zip(raw_df["Part Number"].tolist(), mfgs, raw_df["Quantity"].tolist())]
+            results = analyze_bom(bom_rows, config, mouser_key, nexar_id, nexar_secret,
+                                  on_progress=show_progress, refresh=force_refresh)
 
             progress_bar.empty(); status_txt.empty()
             st.session_state["results"]    = results
+            st.session_state["results_token"] = uuid.uuid4().hex
             st.session_state["strategies"] = calculate_strategies(results, config)
+            st.session_state["summary"]    = summarize_results(results)
             st.success(f"✅ Analysis complete — {len(results)} parts processed")
 
         # ── Results Display ────────────────────────────────────────────────
         if "results" in st.session_state:
             results    = st.session_state["results"]
             strategies = st.session_state["strategies"]
+            results_token = st.session_state["results_token"]
 
-            valid_results = [r for r in results if r.get("_valid")]
-
-            # KPI metrics
-            total_cost_best   = sum(r.get("BestTotalCostRaw", 0) or 0 for r in valid_results)
-            total_cost_tariff = sum(r.get("BestTotalWithTariff", 0) or 0 for r in valid_results)
+            summary           = st.session_state["summary"]
+            valid_results     = summary["valid"]
+            not_found_parts   = summary["not_found"]
+            total_cost_best   = summary["total_cost_best"]
+            total_cost_tariff = summary["total_cost_tariff"]
             tariff_impact     = total_cost_tariff - total_cost_best
-            high_risk   = sum(1 for r in results if r.get("RiskScore",0) >= 6.6)
-            mod_risk    = sum(1 for r in results if 3.6 <= r.get("RiskScore",0) < 6.6)
-            low_risk    = sum(1 for r in results if r.get("RiskScore",0) < 3.6)
-            eol_count   = sum(1 for r in results if r.get("Status") in ("EOL","Discontinued"))
-            no_stock    = sum(1 for r in results if r.get("StockAvail",0) == 0)
-            not_found   = sum(1 for r in results if not r.get("_valid"))
+            high_risk   = summary["high_risk"]
+            mod_risk    = summary["mod_risk"]
+            low_risk    = summary["low_risk"]
+            eol_count   = summary["eol_count"]
+            no_stock    = summary["no_stock"]
+            not_found   = len(not_found_parts)
 
             st.divider()
             st.markdown('<div class="section-head">📊 Results</div>', unsafe_allow_html=True)
@@ -926,7 +1652,6 @@ if uploaded:
             k6.metric("❌ Not Found / EOL",    f"{not_found + eol_count}")
 
             # ── Not Found Diagnostic ──────────────────────────────────────
-            not_found_parts = [r for r in results if not r.get("_valid")]
             if not_found_parts:
                 with st.expander(f"⚠️ {len(not_found_parts)} part(s) returned no supplier data — click for guidance", expanded=True):
                     st.markdown("""
@@ -949,97 +1674,42 @@ if uploaded:
 
             # ── Tab 1: Full Results ────────────────────────────────────────
             with tab1:
-                display_rows = []
-                for r in results:
-                    display_rows.append({
-                        "Part Number":    r["PartNumber"],
-                        "Description":    r.get("Description","")[:60],
-                        "BOM Qty":        r["QtyNeed"] // total_units,
-                        "Total Qty":      r["QtyNeed"],
-                        "Sources":        r["Sources"],
-                        "Best Supplier":  r["BestCostSrc"],
-                        "Unit Cost ($)":  r.get("BestCostPerRaw", np.nan),
-                        "Total Cost ($)": r.get("BestTotalCostRaw", np.nan),
-                        "w/Tariff ($)":   r.get("BestTotalWithTariff", np.nan),
-                        "Tariff":         r["TariffPct"],
-                        "Stock":          r["StockAvail"],
-                        "Lead (days)":    r["BestCostLT"],
-                        "COO":            r["COO"],
-                        "Status":         r["Status"],
-                        "Risk Score":     r["RiskScore"],
-                        "Notes":          r.get("Notes",""),
-                    })
-                res_df = pd.DataFrame(display_rows)
+                res_df = session_memo("res_df", (results_token, total_units),
+                                      lambda: build_display_df(results, total_units))
 
                 # Risk filter
                 risk_filter = st.radio("Filter by Risk:", ["All","🔴 High","🟡 Moderate","🟢 Low"],
                                         horizontal=True, key="risk_filter_tab1")
                 if risk_filter == "🔴 High":
-                    res_df = res_df[res_df["Risk Score"] >= 6.6]
+                    res_df = res_df[res_df["Risk Score"] >= RISK_HIGH_MIN]
                 elif risk_filter == "🟡 Moderate":
-                    res_df = res_df[(res_df["Risk Score"] >= 3.6) & (res_df["Risk Score"] < 6.6)]
+                    res_df = res_df[(res_df["Risk Score"] >= RISK_MOD_MIN) & (res_df["Risk Score"] < RISK_HIGH_MIN)]
                 elif risk_filter == "🟢 Low":
-                    res_df = res_df[res_df["Risk Score"] < 3.6]
+                    res_df = res_df[res_df["Risk Score"] < RISK_MOD_MIN]
 
                 styled = res_df.style\
-                    .applymap(color_risk_cell, subset=["Risk Score"])\
+                    .apply(color_risk_col, subset=["Risk Score"])\
                     .format({
-                        "Unit Cost ($)":  lambda v: f"${v:.4f}" if pd.notna(v) else "N/A",
-                        "Total Cost ($)": lambda v: f"${v:,.2f}" if pd.notna(v) else "N/A",
-                        "w/Tariff ($)":   lambda v: f"${v:,.2f}" if pd.notna(v) else "N/A",
-                        "Risk Score":     lambda v: f"{v:.1f}" if pd.notna(v) else "N/A",
-                    })
+                        "Unit Cost ($)":  "${:.4f}",
+                        "Total Cost ($)": "${:,.2f}",
+                        "w/Tariff ($)":   "${:,.2f}",
+                        "Tariff":         "{:.1%}",
+                        "Lead (days)":    "{:.0f}",
+                        "Risk Score":     "{:.1f}",
+                    }, na_rep="N/A")
                 st.dataframe(styled, use_container_width=True, height=500)
 
                 # Risk factor breakdown
                 with st.expander("🔍 Risk Factor Details per Part"):
-                    rf_rows = []
-                    for r in sorted(results, key=lambda x: x.get("RiskScore",0), reverse=True):
-                        rf = r.get("RiskFactors", {})
-                        rf_rows.append({
-                            "Part Number": r["PartNumber"],
-                            "Overall Risk": r["RiskScore"],
-                            "Sourcing":    rf.get("Sourcing",""),
-                            "Stock":       rf.get("Stock",""),
-                            "Lead Time":   rf.get("LeadTime",""),
-                            "Lifecycle":   rf.get("Lifecycle",""),
-                            "Geographic":  rf.get("Geographic",""),
-                            "Status":      r["Status"],
-                            "COO":         r["COO"],
-                        })
-                    rf_df = pd.DataFrame(rf_rows)
-                    st.dataframe(rf_df.style.applymap(color_risk_cell, subset=["Overall Risk"]),
+                    rf_df = session_memo("rf_df", results_token, lambda: build_risk_factor_df(results))
+                    st.dataframe(rf_df.style.apply(color_risk_col, subset=["Overall Risk"]),
                                  use_container_width=True)
 
                 # Export
-                export_df = pd.DataFrame([{
-                    "Part Number":    r["PartNumber"],
-                    "Manufacturer":   r["Manufacturer"],
-                    "MfgPN":          r["MfgPN"],
-                    "Description":    r.get("Description",""),
-                    "BOM Qty":        r["QtyNeed"] // total_units,
-                    "Total Qty Needed": r["QtyNeed"],
-                    "Best Supplier":  r["BestCostSrc"],
-                    "Unit Cost ($)":  r.get("BestCostPerRaw",""),
-                    "Total Cost ($)": r.get("BestTotalCostRaw",""),
-                    "Total w/Tariff ($)": r.get("BestTotalWithTariff",""),
-                    "Tariff Rate":    r["TariffPct"],
-                    "Actual Buy Qty": r["ActualBuyQty"],
-                    "Stock Available": r["StockAvail"],
-                    "Lead Time (days)": r["BestCostLT"],
-                    "COO":            r["COO"],
-                    "Status":         r["Status"],
-                    "Risk Score":     r["RiskScore"],
-                    "Sourcing Risk":  r.get("RiskFactors",{}).get("Sourcing",""),
-                    "Stock Risk":     r.get("RiskFactors",{}).get("Stock",""),
-                    "LeadTime Risk":  r.get("RiskFactors",{}).get("LeadTime",""),
-                    "Lifecycle Risk": r.get("RiskFactors",{}).get("Lifecycle",""),
-                    "Geographic Risk": r.get("RiskFactors",{}).get("Geographic",""),
-                    "Datasheet":      r.get("DatasheetUrl",""),
-                    "Notes":          r.get("Notes",""),
-                } for r in results])
+                export_csv = session_memo("export_csv", (results_token, total_units),
+                                          lambda: to_csv_bytes(build_export_df(results, total_units)))
                 st.download_button("⬇️ Export Full BOM Analysis CSV",
-                    export_df.to_csv(index=False),
+                    export_csv,
                     f"BOM_Analysis_{datetime.now():%Y%m%d_%H%M%S}.csv",
                     "text/csv", use_container_width=True)
 
@@ -1058,37 +1728,21 @@ if uploaded:
 
                 chosen_strat = st.selectbox("📋 View / Export Strategy Details:",
                                             list(strategies.keys()))
-                strat_parts = strategies[chosen_strat]["parts"]
-                strat_rows  = []
-                for pn, opt in strat_parts.items():
-                    lt_val = opt.get("lead_time", np.inf)
-                    lt_str = f"{lt_val:.0f}" if (pd.notna(lt_val) and not np.isinf(lt_val)) else "In Stock / N/A"
-                    strat_rows.append({
-                        "Part Number":   pn,
-                        "Supplier":      opt.get("source","N/A"),
-                        "Unit Cost ($)": opt.get("unit_cost", np.nan),
-                        "Total Cost ($)": opt.get("cost", np.nan),
-                        "Qty Order":     opt.get("actual_order_qty","N/A"),
-                        "Stock":         opt.get("stock",0),
-                        "Lead (days)":   lt_str,
-                        "Notes":         opt.get("notes",""),
-                    })
-                strat_df = pd.DataFrame(strat_rows)
+                strat_key = (results_token, chosen_strat)
+                strat_df  = session_memo("strat_df", strat_key,
+                                         lambda: build_strategy_df(strategies[chosen_strat]["parts"]))
                 st.dataframe(strat_df.style.format({
-                    "Unit Cost ($)":  lambda v: f"${v:.4f}" if pd.notna(v) else "N/A",
-                    "Total Cost ($)": lambda v: f"${v:,.2f}" if pd.notna(v) else "N/A",
-                }), use_container_width=True, height=450)
+                    "Unit Cost ($)":  "${:.4f}",
+                    "Total Cost ($)": "${:,.2f}",
+                }, na_rep="N/A"), use_container_width=True, height=450)
 
-                strat_export = strat_df.copy()
                 st.download_button(f"⬇️ Export '{chosen_strat}' Strategy CSV",
-                    strat_export.to_csv(index=False),
+                    session_memo("strat_csv", strat_key, lambda: to_csv_bytes(strat_df)),
                     f"Strategy_{chosen_strat.replace(' ','_')}_{datetime.now():%Y%m%d_%H%M}.csv",
                     "text/csv", use_container_width=True)
 
             # ── Tab 3: Visualizations ──────────────────────────────────────
             with tab3:
-                import matplotlib.pyplot as plt
-
                 chart_type = st.selectbox("Select Chart:", [
                     "Risk Score Distribution",
                     "Top Parts by Cost",
@@ -1097,85 +1751,12 @@ if uploaded:
                     "COO Geographic Risk Map",
                     "Strategy Cost Comparison",
                 ])
-                fig, ax = plt.subplots(figsize=(11,5))
-                fig.patch.set_facecolor("#f8f9fa"); ax.set_facecolor("#f8f9fa")
-
-                if chart_type == "Risk Score Distribution":
-                    bins   = [0, 3.5, 6.5, 10]
-                    labels = ["🟢 Low (0–3.5)", "🟡 Moderate (3.6–6.5)", "🔴 High (6.6–10)"]
-                    colors = ["#107c10","#ca5010","#d13438"]
-                    counts = [
-                        sum(1 for r in results if r.get("RiskScore",0) <= 3.5),
-                        sum(1 for r in results if 3.5 < r.get("RiskScore",0) <= 6.5),
-                        sum(1 for r in results if r.get("RiskScore",0) > 6.5),
-                    ]
-                    bars = ax.bar(labels, counts, color=colors, width=0.5)
-                    for bar,v in zip(bars,counts):
-                        ax.text(bar.get_x()+bar.get_width()/2, bar.get_height()+0.1, str(v),
-                                ha="center", fontweight="bold", fontsize=12)
-                    ax.set_ylabel("Number of Parts"); ax.set_title("Risk Score Distribution")
-
-                elif chart_type == "Top Parts by Cost":
-                    top = sorted(valid_results, key=lambda r: r.get("BestTotalCostRaw",0) or 0, reverse=True)[:20]
-                    ax.barh([r["PartNumber"] for r in top],
-                            [r.get("BestTotalCostRaw",0) or 0 for r in top], color="#0078d4")
-                    ax.set_xlabel("Extended Cost ($)"); ax.set_title("Top 20 Parts by Cost")
-
-                elif chart_type == "Stock vs Qty Needed":
-                    scores  = [r.get("RiskScore",0) for r in results]
-                    x_vals  = [r.get("QtyNeed",0) for r in results]
-                    y_vals  = [r.get("StockAvail",0) for r in results]
-                    sc = ax.scatter(x_vals, y_vals, c=scores, cmap="RdYlGn_r",
-                                   s=80, alpha=0.75, vmin=0, vmax=10)
-                    mx = max(max(x_vals,default=1), max(y_vals,default=1))*1.1
-                    ax.plot([0,mx],[0,mx],"k--",alpha=0.4,label="Stock = Needed")
-                    plt.colorbar(sc, ax=ax, label="Risk Score")
-                    ax.set_xlabel("Qty Needed"); ax.set_ylabel("Stock Available")
-                    ax.set_title("Stock vs Quantity Needed")
-                    ax.legend()
-
-                elif chart_type == "Cost + Tariff Impact (Top 15)":
-                    top = sorted(valid_results, key=lambda r: r.get("BestTotalCostRaw",0) or 0, reverse=True)[:15]
-                    pns  = [r["PartNumber"] for r in top]
-                    base = [r.get("BestTotalCostRaw",0) or 0 for r in top]
-                    tariff_add = [(r.get("BestTotalWithTariff",0) or 0) - (r.get("BestTotalCostRaw",0) or 0) for r in top]
-                    x = range(len(pns))
-                    ax.bar(x, base, label="Base Cost", color="#0078d4")
-                    ax.bar(x, tariff_add, bottom=base, label="Tariff Add-on", color="#d13438", alpha=0.8)
-                    ax.set_xticks(list(x)); ax.set_xticklabels(pns, rotation=45, ha="right", fontsize=8)
-                    ax.set_ylabel("Cost ($)"); ax.set_title("Base Cost vs Tariff Impact")
-                    ax.legend()
-
-                elif chart_type == "COO Geographic Risk Map":
-                    coo_risk = {}
-                    for r in results:
-                        coo = r.get("COO","Unknown")
-                        geo = r.get("RiskFactors",{}).get("Geographic", GEO_RISK_TIERS.get("_DEFAULT_",4))
-                        coo_risk[coo] = max(coo_risk.get(coo,0), geo)
-                    coos  = list(coo_risk.keys())
-                    risks = list(coo_risk.values())
-                    colors= ["#d13438" if v>=7 else "#ca5010" if v>=4 else "#107c10" for v in risks]
-                    ax.barh(coos, risks, color=colors)
-                    ax.set_xlabel("Geographic Risk Score (0-10)")
-                    ax.set_title("Geographic Risk by Country of Origin")
-                    ax.axvline(x=5, color="orange", linestyle="--", alpha=0.6, label="Moderate threshold")
-                    ax.axvline(x=7, color="red",    linestyle="--", alpha=0.6, label="High threshold")
-                    ax.legend(fontsize=8)
-
-                elif chart_type == "Strategy Cost Comparison":
-                    names  = list(strategies.keys())
-                    totals = [strategies[n]["total_cost"] for n in names]
-                    colors = ["#0078d4","#107c10","#ca5010","#d13438"]
-                    bars   = ax.bar(names, totals, color=colors[:len(names)], width=0.5)
-                    for bar, v in zip(bars,totals):
-                        ax.text(bar.get_x()+bar.get_width()/2, bar.get_height()+5,
-                                f"${v:,.0f}", ha="center", fontsize=9, fontweight="bold")
-                    ax.set_ylabel("Total BOM Cost ($)"); ax.set_title("Purchasing Strategy Cost Comparison")
-                    ax.set_xticklabels(names, rotation=10, ha="right")
-
-                plt.tight_layout()
-                st.pyplot(fig)
-                plt.close()
+                if chart_type in VEGA_CHARTS:
+                    chart_df, spec = session_memo("vega_chart", (results_token, chart_type),
+                                                  lambda: VEGA_CHARTS[chart_type](results, valid_results, strategies))
+                    st.vega_lite_chart(chart_df, spec, use_container_width=True)
+                else:
+                    st.pyplot(render_chart(chart_type, results_token, results, strategies))
 
             # ── Tab 4: AI Summary ──────────────────────────────────────────
             with tab4:
@@ -1187,16 +1768,16 @@ if uploaded:
                                "Get one at [console.groq.com](https://console.groq.com) — no credit card needed.")
                 else:
                     # Build a rich prompt context matching original app's AI logic
-                    high_risk_parts = [r for r in results if r.get("RiskScore",0) >= 6.6]
-                    eol_parts       = [r for r in results if r.get("Status") in ("EOL","Discontinued")]
-                    stock_gap_parts = [r for r in results if r.get("StockAvail",0) < r.get("QtyNeed",0)]
-                    no_price_parts  = [r for r in results if not r.get("_valid")]
+                    high_risk_parts = summary["high_risk_parts"]
+                    eol_parts       = summary["eol_parts"]
+                    stock_gap_parts = summary["stock_gap_parts"]
+                    no_price_parts  = not_found_parts
 
                     critical_detail = ""
                     for r in high_risk_parts[:8]:
                         critical_detail += (f"\n  - {r['PartNumber']}: Risk={r['RiskScore']}, "
                                             f"Stock={r['StockAvail']}/{r['QtyNeed']} needed, "
-                                            f"LT={r['BestCostLT']} days, Status={r['Status']}, COO={r['COO']}")
+                                            f"LT={fmt_int(r['BestCostLT'])} days, Status={r['Status']}, COO={r['COO']}")
 
                     strat_summary_text = ""
                     for sname, sdata in strategies.items():